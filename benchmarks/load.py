@@ -0,0 +1,377 @@
+"""Load generator for the server.
+
+Opens N connections and sends a weighted mix of requests for a fixed
+time. In the default closed-loop mode every connection sends its next
+request as soon as the previous response arrives. With --rate the
+requests are scheduled at fixed intervals (open loop) and latency is
+measured from the scheduled time, so a stalled server is not hidden
+by clients that stop sending (coordinated omission).
+
+    python benchmarks/load.py -c 32 -d 10 --mix index=80,media=15,login=5
+    python benchmarks/load.py -c 16 -d 10 --pipeline 8 --json result.json
+    python benchmarks/load.py -c 64 -d 10 --rate 2000
+
+The default config.ini limits connections and requests per client IP,
+so raise client-connections-limit and too-many-requests-limit before
+measuring throughput. Uploads add a file to the media folder per request.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from threading import Thread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REQUESTS_FOLDER = os.path.join(ROOT, "tests", "test_requests")
+UPLOAD_FILE = os.path.join(ROOT, "tests", "test_media", "LC-84.jpg")
+WORKLOADS = ("index", "media", "login", "upload")
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def load_template(name):
+    """Returns the header lines of a captured browser request without the
+    request line and the body, with LF line endings normalized"""
+    with open(os.path.join(REQUESTS_FOLDER, name), "r") as f:
+        head, _, body = f.read().partition("\n\n")
+    lines = [
+        line
+        for line in head.split("\n")[1:]
+        if line
+        and not line.lower().startswith(("content-length:", "connection:", "host:"))
+    ]
+    return lines, body.encode("utf-8")
+
+
+def build_request(method, url, headers, host, keep_alive, body=b""):
+    lines = [f"{method} {url} HTTP/1.1", f"Host: {host}"]
+    lines += headers
+    if keep_alive:
+        lines.append("Connection: keep-alive")
+    if body:
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + body
+
+
+def build_requests(args):
+    """Returns a request for every workload as bytes"""
+    host = f"{args.host}:{args.port}"
+    keep_alive = not args.no_keep_alive
+    index_headers, _ = load_template("index_request.txt")
+    login_headers, login_body = load_template("logger_name_request.txt")
+    upload_headers, _ = load_template("upload_image_request.txt")
+
+    content_type = next(h for h in upload_headers if h.startswith("Content-Type:"))
+    boundary = content_type.split("boundary=", 1)[1].strip()
+    with open(UPLOAD_FILE, "rb") as f:
+        image = f.read()
+    upload_body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="image"; '
+        f'filename="{os.path.basename(UPLOAD_FILE)}"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode("utf-8") + image + f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    return {
+        "index": build_request("GET", "/", index_headers, host, keep_alive),
+        "media": build_request("GET", args.media_url, index_headers, host, keep_alive),
+        "login": build_request(
+            "POST", "/logger_name", login_headers, host, keep_alive, login_body
+        ),
+        "upload": build_request(
+            "POST", "/uploaded_image", upload_headers, host, keep_alive, upload_body
+        ),
+    }
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in WORKLOADS:
+            raise argparse.ArgumentTypeError(f"unknown workload {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Connection:
+    """Client socket that reads responses by Content-Length and reconnects
+    when the server closes the connection"""
+
+    def __init__(self, address, timeout):
+        self._address = address
+        self._timeout = timeout
+        self._sock = None
+        self._buffer = bytearray()
+        self.remaining = None
+
+    def send(self, data):
+        if self._sock is None:
+            self._sock = socket.create_connection(self._address, self._timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock.sendall(data)
+
+    def read_response(self):
+        """Returns (status code, total bytes) of the next response"""
+        while True:
+            end = self._buffer.find(b"\r\n\r\n")
+            if end != -1:
+                break
+            self._recv()
+        head = bytes(self._buffer[:end]).decode("latin-1")
+        del self._buffer[: end + 4]
+        code = int(head.split(" ", 2)[1])
+        length, close = 0, False
+        for line in head.split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection":
+                close = close or value.strip().lower() == "close"
+            elif name == "keep-alive" and "max=" in value:
+                self.remaining = int(value.split("max=", 1)[1].split(",")[0])
+                close = close or self.remaining == 0
+        while len(self._buffer) < length:
+            self._recv()
+        del self._buffer[:length]
+        if close:
+            self.close()
+        return code, end + 4 + length
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._buffer.clear()
+        self.remaining = None
+
+    def _recv(self):
+        data = self._sock.recv(65536)
+        if not data:
+            self.close()
+            raise ConnectionError("connection closed by server")
+        self._buffer += data
+
+
+class Worker(Thread):
+    def __init__(self, index, args, requests, deadline, start_time):
+        super().__init__(daemon=True)
+        self.index = index
+        self.args = args
+        self.requests = requests
+        self.deadline = deadline
+        self.start_time = start_time
+        self.latencies = []
+        self.codes = {}
+        self.errors = 0
+        self.bytes = 0
+        self._random = random.Random(args.seed + index)
+        self._names = list(args.mix)
+        self._weights = list(args.mix.values())
+
+    def run(self):
+        connection = Connection((self.args.host, self.args.port), self.args.timeout)
+        if self.args.rate:
+            self._run_open_loop(connection)
+        else:
+            time.sleep(max(0.0, self.start_time - time.perf_counter()))
+            self._run_closed_loop(connection)
+        connection.close()
+
+    def _run_closed_loop(self, connection):
+        while time.perf_counter() < self.deadline:
+            names = self._choose_batch(connection.remaining)
+            started = time.perf_counter()
+            try:
+                connection.send(b"".join(self.requests[name] for name in names))
+                for _ in names:
+                    self._record(connection.read_response(), started)
+            except (OSError, ValueError, IndexError):
+                self._fail(connection)
+            if self.args.no_keep_alive:
+                connection.close()
+
+    def _run_open_loop(self, connection):
+        """Sends request k of this worker at start + (k * N + index) / rate"""
+        interval = self.args.connections / self.args.rate
+        scheduled = self.start_time + self.index / self.args.rate
+        while scheduled < self.deadline:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                connection.send(self.requests[self._choose()])
+                self._record(connection.read_response(), scheduled)
+            except (OSError, ValueError, IndexError):
+                self._fail(connection)
+            if self.args.no_keep_alive:
+                connection.close()
+            scheduled += interval
+
+    def _choose(self):
+        return self._random.choices(self._names, self._weights)[0]
+
+    def _choose_batch(self, remaining):
+        """Only GET requests are pipelined because the server closes the
+        connection after a POST, and no more than the server still accepts
+        on this connection"""
+        limit = min(self.args.pipeline, remaining or self.args.pipeline)
+        names = [self._choose()]
+        while len(names) < limit and names[-1] in ("index", "media"):
+            name = self._choose()
+            if name not in ("index", "media"):
+                break
+            names.append(name)
+        return names
+
+    def _record(self, result, started):
+        code, length = result
+        self.latencies.append(time.perf_counter() - started)
+        self.codes[code] = self.codes.get(code, 0) + 1
+        self.bytes += length
+
+    def _fail(self, connection):
+        self.errors += 1
+        connection.close()
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(1, int(-(-p * len(values) // 100)))
+    return values[min(rank, len(values)) - 1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    requests = build_requests(args)
+    if "media" in args.mix and not args.skip_media_upload:
+        warmup = Connection((args.host, args.port), args.timeout)
+        warmup.send(requests["upload"])
+        warmup.read_response()
+        warmup.close()
+
+    start_time = time.perf_counter() + 0.1
+    deadline = start_time + args.duration
+    workers = [
+        Worker(i, args, requests, deadline, start_time)
+        for i in range(args.connections)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start_time
+
+    latencies = sorted(value for worker in workers for value in worker.latencies)
+    codes = {}
+    for worker in workers:
+        for code, count in worker.codes.items():
+            codes[str(code)] = codes.get(str(code), 0) + count
+    completed = len(latencies)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "host": args.host,
+            "port": args.port,
+            "connections": args.connections,
+            "duration": args.duration,
+            "keep_alive": not args.no_keep_alive,
+            "pipeline": args.pipeline,
+            "rate": args.rate,
+            "mix": args.mix,
+        },
+        "requests": completed,
+        "errors": sum(worker.errors for worker in workers),
+        "codes": codes,
+        "elapsed": elapsed,
+        "throughput": completed / elapsed,
+        "bytes_per_second": sum(worker.bytes for worker in workers) / elapsed,
+        "latency": {
+            "mean": sum(latencies) / completed if completed else None,
+            "max": latencies[-1] if completed else None,
+            **{f"p{p:g}": percentile(latencies, p) for p in PERCENTILES},
+        },
+    }
+
+
+def print_report(result):
+    print(
+        f"{result['requests']} requests in {result['elapsed']:.2f}s, "
+        f"{result['errors']} errors, codes {result['codes']}"
+    )
+    print(
+        f"throughput: {result['throughput']:.1f} req/s, "
+        f"{result['bytes_per_second'] / 1e6:.2f} MB/s"
+    )
+    for name, value in result["latency"].items():
+        shown = "-" if value is None else f"{value * 1000:.3f} ms"
+        print(f"{name:>6}: {shown}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP server load generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("-c", "--connections", type=int, default=8)
+    parser.add_argument("-d", "--duration", type=float, default=10)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("index=1"),
+        help="weighted workloads, e.g. index=70,media=20,login=8,upload=2",
+    )
+    parser.add_argument("--media-url", default="/LC-84.jpg")
+    parser.add_argument(
+        "--skip-media-upload",
+        action="store_true",
+        help="do not upload the media file before a mix with media GETs",
+    )
+    parser.add_argument("--no-keep-alive", action="store_true")
+    parser.add_argument(
+        "--pipeline", type=int, default=1, help="GET requests sent at once"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="open-loop requests per second"
+    )
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the result to a file, - for stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run(args)
+    if args.json == "-":
+        json.dump(result, sys.stdout, indent=2)
+        print()
+        return
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Microbenchmarks for the request hot path.
+
+Measures operations per second and the peak memory traced by
+tracemalloc during one call of the parser, the response cache, the
+file manager lookups and the response generator. Results are compared
+with benchmarks/baseline.json and the run fails when a benchmark is
+slower, or allocates more, than the baseline by more than the
+threshold.
+
+    python benchmarks/micro.py
+    python benchmarks/micro.py --threshold 0.5 -k parse
+    python benchmarks/micro.py --update-baseline
+
+Timings depend on the machine, so the baseline should be recorded on
+the machine that runs the comparison.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models.request import Request  # noqa: E402
+from utils.file_manager import FileManager  # noqa: E402
+from utils.request_parser import RequestParser  # noqa: E402
+from utils.response_cache import ResponseCache  # noqa: E402
+from utils.response_generator import ResponseGenerator  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+REQUESTS_FOLDER = os.path.join(ROOT, "tests", "test_requests")
+PAGES_COUNT = 2000
+MEDIA_COUNT = 2000
+ALLOC_SAMPLES = 50
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers a setup function that returns the callable to measure"""
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+class Tree:
+    """Temporary root and media folders with thousands of files"""
+
+    def __init__(self):
+        self.folder = tempfile.mkdtemp()
+        self.root = os.path.join(self.folder, "root")
+        self.media = os.path.join(self.folder, "media")
+        self.home_page = os.path.join(self.root, "index.html")
+        for i in range(PAGES_COUNT):
+            directory = os.path.join(self.root, f"section{i % 20}")
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"page{i}.html"), "w") as f:
+                f.write(f"<html><body><p>page {i}</p></body></html>")
+        with open(self.home_page, "w") as f:
+            f.write("<html>" + "<p>index</p>" * 100 + "</html>")
+        os.makedirs(self.media)
+        for i in range(MEDIA_COUNT):
+            with open(os.path.join(self.media, f"image{i}.jpg"), "wb") as f:
+                f.write(b"\xff\xd8" + bytes(64))
+        self.file_manager = FileManager(self.root, self.home_page, self.media)
+
+    def close(self):
+        shutil.rmtree(self.folder)
+
+
+def large_head():
+    """The captured browser request with 30 more headers, as the server
+    receives it"""
+    with open(os.path.join(REQUESTS_FOLDER, "index_request.txt")) as f:
+        lines = f.read().strip().split("\n")
+    lines += [f"X-Custom-Header-{i}: {'v' * 40}" for i in range(30)]
+    return "\r\n".join(lines).encode("utf-8")
+
+
+def make_request(url):
+    request = Request("GET", url, "HTTP/1.1", url.rsplit("/", 1)[-1])
+    request.connection = "keep-alive"
+    request.requests_count = 1
+    return request
+
+
+@benchmark("parse_request")
+def bench_parse_request(tree):
+    parser = RequestParser(tree.file_manager)
+    head = large_head()
+    return lambda: parser.parse_request(head)
+
+
+@benchmark("response_cache_churn")
+def bench_response_cache_churn(tree):
+    """Random gets over four times more urls than the cache holds, with a
+    put after every miss"""
+    cache = ResponseCache(1024, 1 << 20, 8)
+    rng = random.Random(0)
+    urls = [f"/page{rng.randrange(4096)}" for _ in range(1 << 16)]
+    keys = itertools.cycle(urls)
+    variant = ("GET", 200, None)
+
+    def run():
+        url = next(keys)
+        if cache.get(url, variant) is None:
+            cache.put(url, variant, url, 256)
+
+    return run
+
+
+@benchmark("file_manager_get_route")
+def bench_get_route(tree):
+    urls = itertools.cycle(
+        [f"/section{i % 20}/page{i}" for i in range(0, PAGES_COUNT, 7)]
+    )
+    get_route = tree.file_manager.get_route
+    return lambda: get_route(next(urls))
+
+
+@benchmark("file_manager_get_page_path")
+def bench_get_page_path(tree):
+    urls = itertools.cycle([f"/image{i}.jpg" for i in range(0, MEDIA_COUNT, 7)])
+    get_page_path = tree.file_manager.get_page_path
+    return lambda: get_page_path(next(urls))
+
+
+@benchmark("generate_response_cached")
+def bench_generate_response_cached(tree):
+    generator = ResponseGenerator(
+        tree.file_manager, 50, True, ResponseCache(256, 1 << 20), 2, 1 << 16
+    )
+    request = make_request("/")
+    return lambda: generator.generate_response(request)
+
+
+@benchmark("generate_response_uncached")
+def bench_generate_response_uncached(tree):
+    generator = ResponseGenerator(tree.file_manager, 50, True, None, 2, 1 << 16)
+    request = make_request("/section3/page3")
+    return lambda: generator.generate_response(request)
+
+
+@benchmark("generate_response_not_found")
+def bench_generate_response_not_found(tree):
+    generator = ResponseGenerator(tree.file_manager, 50, True, None, 2, 1 << 16)
+    request = make_request("/missing")
+    return lambda: generator.generate_response(request)
+
+
+def measure(func, repeat):
+    """Returns the best ops/sec over repeat runs and the median peak of
+    traced memory during one call"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number))
+    func()
+    tracemalloc.start()
+    peaks = []
+    for _ in range(ALLOC_SAMPLES):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        func()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return {"ops_per_sec": number / best, "alloc_bytes": statistics.median(peaks)}
+
+
+def compare(name, result, baseline, threshold):
+    """Returns a description of every regression of result"""
+    regressions = []
+    expected = baseline.get(name)
+    if expected is None:
+        return regressions
+    if result["ops_per_sec"] < expected["ops_per_sec"] * (1 - threshold):
+        regressions.append(
+            f"{name}: {result['ops_per_sec']:.0f} ops/s, "
+            f"baseline {expected['ops_per_sec']:.0f} ops/s"
+        )
+    if result["alloc_bytes"] > expected["alloc_bytes"] * (1 + threshold) + 64:
+        regressions.append(
+            f"{name}: {result['alloc_bytes']:.0f} bytes per call, "
+            f"baseline {expected['alloc_bytes']:.0f} bytes"
+        )
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Hot path microbenchmarks")
+    parser.add_argument("-k", help="run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed slowdown or extra allocation as a fraction of the baseline",
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="store the results as the new baseline",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = load_baseline(args.baseline)
+    tree = Tree()
+    results = {}
+    regressions = []
+    try:
+        for name, setup in BENCHMARKS.items():
+            if args.k and args.k not in name:
+                continue
+            result = measure(setup(tree), args.repeat)
+            results[name] = result
+            regressions += compare(name, result, baseline, args.threshold)
+            expected = baseline.get(name, {}).get("ops_per_sec")
+            change = ""
+            if expected:
+                change = f" ({result['ops_per_sec'] / expected - 1:+.1%})"
+            print(
+                f"{name:<30} {result['ops_per_sec']:>12.0f} ops/s{change:<10} "
+                f"{result['alloc_bytes']:>8.0f} bytes/call"
+            )
+    finally:
+        tree.close()
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
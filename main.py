@@ -1,60 +1,155 @@
+import asyncio
 import configparser
 import os
+import signal
 import socket
 import logging
 from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
+from threading import Lock, current_thread, main_thread
 import time
 
 import models.exceptions as exc
+from models.response import FileRange
+from utils.access_log import AccessLog
+from utils.buffer_pool import BufferPool
+from utils.connection_manager import Connection, ConnectionManager
+from utils.connection_reader import ConnectionReader
 from utils.file_manager import FileManager
+from utils.file_watcher import FileWatcher
+from utils.metrics import (
+    ACTIVE_CONNECTIONS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    IDLE_CONNECTIONS,
+    RESPONSES,
+    SENT_BYTES,
+    Metrics,
+)
+from utils.rate_limiter import RateLimiter
 from utils.request_parser import RequestParser
-from utils.response_generator import ResponseGenerator
-from utils.page_caching import CashList
+from utils.response_generator import SENDFILE_MIN_SIZE, ResponseGenerator
+from utils.response_cache import ResponseCache
+from utils.scheduler import ByteBudget, Lane
+from utils.worker_supervisor import WorkerSupervisor
 
 
 class Server:
-    def __init__(self, config):
+    def __init__(self, config, access_log_mode="w", rotate_access_log=True):
         try:
             self._port = int(config["port"])
             self._ip_address = config["ip-address"]
             self._request_size = int(config["request-size"])
+            self._header_size_limit = int(config.get("header-size-limit", 8192))
+            self._buffer_pool = BufferPool(
+                max(self._request_size, self._header_size_limit + 4),
+                int(config.get("receive-buffer-pool-bytes", 1 << 20)),
+                int(config.get("receive-buffer-limit-bytes", 64 << 20)),
+            )
 
             self._connections_limit = int(config["connections-limit"])
             self._client_connections_limit = int(config["client-connections-limit"])
-            self._active_connections = {}
-
-            self._too_many_requests_span = int(config["too-many-requests-span"])
-            self._too_many_requests_limit = int(config["too-many-requests-limit"])
+            self._rate_limiter = RateLimiter(
+                int(config["too-many-requests-limit"]),
+                int(config["too-many-requests-span"]),
+                config.get("rate-limit-algorithm", "sliding-window"),
+                int(config.get("rate-limit-shards", 16)),
+                int(config.get("rate-limit-idle-timeout", 60)),
+            )
 
+            self._work_queue_limit = int(config.get("work-queue-limit", 100))
+            self._header_read_timeout = float(config.get("header-read-timeout", 5))
+            self._busy_retry_after = int(config.get("busy-retry-after", 1))
+            self._keep_alive_linger = float(config.get("keep-alive-linger", 0.002))
+            self._dynamic_lane = self._create_lane(
+                "dynamic",
+                int(config.get("dynamic-workers", 4)),
+                int(config.get("dynamic-queue-limit", 50)),
+            )
+            self._upload_lane = self._create_lane(
+                "upload",
+                int(config.get("upload-workers", 2)),
+                int(config.get("upload-queue-limit", 10)),
+            )
+            self._upload_budget = ByteBudget(
+                int(config.get("upload-max-inflight-bytes", 64 << 20))
+            )
+            self._connection_manager = None
             self._keep_alive = bool(config["keep-alive"])
             self._keep_alive_timeout = int(config["keep-alive-timeout"])
             self._keep_alive_max_requests = int(config["keep-alive-max-requests"])
             self._debug = bool(config["debug"])
+            self._server_mode = config.get("server-mode", "threaded")
+            self._async_file_workers = int(config.get("async-file-workers", 4))
             self._file_manager = FileManager(
                 os.path.join(os.getcwd(), config["root"]),
                 os.path.join(os.getcwd(), config["home-page-path"]),
                 os.path.join(os.getcwd(), config["media"]),
+                bool(config["browser-caching"]),
+                config.get("index-snapshot"),
+                config.get("media-storage", "names") == "content",
+                float(config.get("index-snapshot-save-delay", 30)),
             )
 
             cash_size = int(config["server-cash-size"])
-            self._server_cash_list = CashList(cash_size) if cash_size > 0 else None
+            self._response_cache = None
+            if cash_size > 0:
+                self._response_cache = ResponseCache(
+                    cash_size,
+                    int(config.get("server-cash-max-bytes", 1 << 20)),
+                    int(config.get("server-cash-shards", 8)),
+                    int(config.get("server-cash-ttl", 0)),
+                )
+
+            compression_min_size = None
+            if config.get("compression", "False") == "True":
+                compression_min_size = int(config.get("compression-min-size", 1024))
+
+            self._file_watcher = None
+            if config.get("watch-files", "False") == "True":
+                self._file_watcher = FileWatcher(
+                    self._file_manager,
+                    self._response_cache,
+                    config.get("watch-backend", "auto"),
+                    float(config.get("watch-interval", 2)),
+                )
 
+            self._metrics = Metrics()
+            self._metrics_url = config.get("metrics-url") or None
             self._mutex = Lock()
+            self._file_executor = None
             self._parser = RequestParser(self._file_manager)
             self._response_generator = ResponseGenerator(
                 self._file_manager,
                 int(config["keep-alive-max-requests"]),
                 bool(config["browser-caching"]),
-                self._server_cash_list,
+                self._response_cache,
                 int(config["keep-alive-timeout"]),
+                int(config.get("sendfile-min-size", SENDFILE_MIN_SIZE)),
+                compression_min_size,
+                int(config.get("compression-level", 6)),
+                int(config.get("download-page-size", 100)),
+            )
+            self._busy_response = self._encode_rejection(503, self._busy_retry_after)
+            self._client_limit_response = self._encode_rejection(
+                429, int(config["too-many-requests-span"])
             )
 
             if not os.path.exists("logs"):
                 os.mkdir("logs")
+            self._access_log = AccessLog(
+                config["access-log"],
+                access_log_mode,
+                config.get("access-log-format", "common"),
+                int(config.get("access-log-queue-size", 10000)),
+                int(config.get("access-log-batch-size", 256)),
+                float(config.get("access-log-flush-interval", 1)),
+                int(config.get("access-log-max-bytes", 0)),
+                int(config.get("access-log-rotate-interval", 0)),
+                int(config.get("access-log-backup-count", 5)),
+                rotate_access_log,
+            )
             logging.basicConfig(
-                filename=config["access-log"],
-                filemode="w",
+                filename=config.get("error-log", "logs/error.log"),
+                filemode=access_log_mode,
                 level=logging.INFO,
                 format="%(levelname)s: [%(asctime)s] %(message)s",
             )
@@ -64,106 +159,471 @@ class Server:
         if self._debug:
             print("Server was initialized successfully", end="\n")
 
-    def handle_client(self, client, address):
+    def _create_lane(self, name, workers_count, queue_limit):
+        if workers_count <= 0:
+            return None
+        return Lane(name, workers_count, queue_limit, self._serve_in_lane)
+
+    def open_connection(self, client, address):
+        """Registers an accepted client. A client over its connection limit
+        is answered with 429 once it sends a request."""
+        if self._keep_alive:
+            self._set_keepalive(client)
+        if self._debug:
+            print(f"Client {address[0]}:{address[1]} connected")
+        if self._register_client(address[0]):
+            return Connection(client, address, rejection=self._client_limit_response)
+        reader = ConnectionReader(
+            client, self._request_size, self._header_size_limit, self._buffer_pool
+        )
+        return Connection(client, address, reader, self._keep_alive)
+
+    def close_connection(self, connection):
+        if connection.reader is not None:
+            connection.reader.close(discard=True)
+        connection.sock.close()
+        self._unregister_client(connection.address[0])
+        if self._debug:
+            address = connection.address
+            print(f"Client {address[0]}:{address[1]} disconnected")
+
+    def serve_connection(self, connection):
+        """Serves the requests of a readable connection while they keep
+        coming. Static requests are served here, others are handed to
+        their lane. Returns True when the connection should be parked
+        until its next request, or None when it was handed to a lane.
+        Heads are read without blocking: a partial one is parked with its
+        deadline, so slow clients do not hold workers."""
+        client, reader = connection.sock, connection.reader
+        while (
+            connection.keep_alive
+            and connection.requests_count < self._keep_alive_max_requests
+        ):
+            if connection.head_deadline is None:
+                connection.head_deadline = (
+                    time.monotonic() + self._header_read_timeout
+                )
+            try:
+                head = reader.read_head(connection.head_deadline, wait=False)
+                connection.head_deadline = None
+                if head is None:
+                    return False
+                client.settimeout(self._keep_alive_timeout)
+                started = time.perf_counter()
+                self._metrics.observe("recv", started - reader.head_started)
+                connection.requests_count += 1
+                request_info = self._prepare_request(
+                    head, connection.address, connection.requests_count
+                )
+                connection.keep_alive = self._is_keep_alive(request_info)
+                if request_info.too_many_requests and request_info.content_length:
+                    return self._reject_rate_limited(connection, request_info)
+                lane = self._select_lane(request_info)
+                if lane is not None:
+                    return self._submit(lane, connection, request_info, started)
+                self._handle_request(connection, request_info, started)
+            except BlockingIOError:
+                if not reader.buffered:
+                    connection.head_deadline = None
+                    reader.close()
+                return True
+            except Exception as e:
+                self._handle_error(client, e)
+                return False
+            if not reader.buffered and not self._connection_manager.wait_readable(
+                connection
+            ):
+                reader.close()
+                return self._can_continue(connection)
+        return False
+
+    def _select_lane(self, request_info):
+        """Uploads and dynamic pages get their own lanes so they cannot
+        take the workers of static pages. None means serve it now."""
+        if request_info.too_many_requests:
+            return None
+        if request_info.method == "POST":
+            if request_info.page_name == "uploaded_image":
+                return self._upload_lane
+            return self._dynamic_lane
+        if request_info.url == self._metrics_url:
+            return self._dynamic_lane
+        route = self._file_manager.get_route(request_info.url)
+        if route is not None and route.dynamic:
+            return self._dynamic_lane
+        return None
+
+    def _reject_rate_limited(self, connection, request_info):
+        """Answers 429 to a rate limited request with a body and closes the
+        connection, so the body is neither read nor saved"""
+        response = self._encode_rejection(429, request_info.too_many_requests)
+        self._connection_manager.reject(connection, response)
+        return None
+
+    def _submit(self, lane, connection, request_info, started):
+        """Queues the request in its lane, or answers 503 when the lane is
+        full or the upload would exceed the bytes uploaded at once. The
+        503 is sent without waiting for the unread body, so a busy server
+        does not spend the worker on it."""
+        size = 0
+        if lane is self._upload_lane:
+            size = request_info.content_length or 0
+            if not self._upload_budget.acquire(size):
+                self._connection_manager.reject(connection, self._busy_response)
+                return None
+        if lane.submit((connection, request_info, started, size)):
+            return None
+        self._upload_budget.release(size)
+        self._connection_manager.reject(connection, self._busy_response)
+        return None
+
+    def _serve_in_lane(self, item):
+        connection, request_info, started, size = item
+        try:
+            self._handle_request(connection, request_info, started)
+        except Exception as e:
+            self._handle_error(connection.sock, e)
+            self.close_connection(connection)
+            return
+        finally:
+            self._upload_budget.release(size)
+        if not self._can_continue(connection):
+            self.close_connection(connection)
+        elif connection.reader.buffered:
+            self._connection_manager.dispatch(connection)
+        else:
+            connection.reader.close()
+            self._connection_manager.park(connection)
+
+    def _handle_request(self, connection, request_info, started):
+        client, reader = connection.sock, connection.reader
+        content_length = request_info.content_length or 0
+        if request_info.method == "POST":
+            if request_info.page_name == "uploaded_image":
+                self._receive_upload(reader, request_info)
+            else:
+                request_body = reader.read_body(content_length)
+                self._parser.parse_request_body(
+                    request_info, request_body.decode("utf-8")
+                )
+        elif content_length:
+            reader.read_body(content_length)
+        response = self._generate_response(request_info)
+        sending = time.perf_counter()
+        self._send_response(client, response)
+        self._metrics.observe("send", time.perf_counter() - sending)
+        self._log_request(request_info, response, started)
+
+    def _handle_error(self, client, error):
+        """Answers a request that failed. Called in an except block."""
+        if isinstance(error, exc.RequestTimeoutException):
+            self._send_error(client, 408)
+        elif isinstance(error, exc.HeaderTooLargeException):
+            self._send_error(client, 431)
+        elif isinstance(error, exc.BadRequestException):
+            self._send_error(client, 400)
+        elif isinstance(error, exc.BufferPoolExhaustedException):
+            self._send_error(client, 503, self._busy_retry_after)
+        elif error.__class__ is not socket.timeout:
+            self._log_error()
+
+    def _can_continue(self, connection):
+        return (
+            connection.keep_alive
+            and connection.requests_count < self._keep_alive_max_requests
+        )
+
+    async def handle_client_async(self, reader, writer):
+        address = writer.get_extra_info("peername")
         keep_alive = self._keep_alive
         requests_count = 0
         ip = address[0]
-        exit = False
-
-        self._mutex.acquire()
-        if ip not in self._active_connections:
-            self._active_connections[ip] = [0, []]
-        self._active_connections[ip][0] += 1
-        self._active_connections[ip][1].append(time.time())
-        client_connections = self._active_connections[ip]
-        tmr = self._too_many_requests(client_connections[1])
-        self._mutex.release()
-
-        if client_connections[0] > self._client_connections_limit:
-            exit = True
+        exit = self._register_client(ip)
+        loop = asyncio.get_running_loop()
 
         if self._debug:
             print(f"Client {address[0]}:{address[1]} connected")
+        if exit:
+            await self._reject_async(reader, writer, self._client_limit_response)
         while (
             not exit and keep_alive and requests_count < self._keep_alive_max_requests
         ):
             try:
-                client.settimeout(self._keep_alive_timeout)
-                data = client.recv(self._request_size)
-                if not data:
-                    break
+                self._metrics.inc(IDLE_CONNECTIONS)
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), self._keep_alive_timeout
+                    )
+                finally:
+                    self._metrics.inc(IDLE_CONNECTIONS, -1)
+                started = time.perf_counter()
                 requests_count += 1
-                data = data.split(b"\r\n\r\n", 1)
-                request = data[0].decode("utf-8")
-
-                request_info = self._parser.parse_request(request)
-                request_info.too_many_requests = tmr
-                request_info.client = address[0]
-                request_info.requests_count = requests_count
-                keep_alive = (
-                    keep_alive
-                    and bool(request_info.connection)
-                    and request_info.method != "POST"
+                request_info = self._prepare_request(
+                    head[:-4], address, requests_count
                 )
+                keep_alive = keep_alive and self._is_keep_alive(request_info)
+                content_length = request_info.content_length or 0
+                if request_info.too_many_requests and content_length:
+                    await self._reject_rate_limited_async(writer, request_info)
+                    break
 
                 if request_info.method == "POST":
                     if request_info.page_name == "uploaded_image":
-                        arr = bytearray(data[1])
-                        additional = b""
-                        if len(arr) < request_info.content_length:
-                            try:
-                                additional = client.recv(self._request_size)
-                                while additional:
-                                    body_part = client.recv(self._request_size)
-                                    if not body_part:
-                                        break
-                                    additional += body_part
-                            except socket.timeout:
-                                pass
-                        request_body = data[1] + additional
+                        await self._receive_upload_async(reader, request_info)
                     else:
-                        request_body = data[1].decode("utf-8")
-                    self._parser.parse_request_body(request_info, request_body)
-                response, code = self._response_generator.generate_response(
-                    request_info
+                        request_body = await asyncio.wait_for(
+                            reader.readexactly(content_length),
+                            self._keep_alive_timeout,
+                        )
+                        self._parser.parse_request_body(
+                            request_info, request_body.decode("utf-8")
+                        )
+                elif content_length:
+                    await asyncio.wait_for(
+                        reader.readexactly(content_length), self._keep_alive_timeout
+                    )
+                response = await loop.run_in_executor(
+                    self._file_executor, self._generate_response, request_info
                 )
-                self._mutex.acquire()
-                logging.info(
-                    f"{request_info.client} - {request_info.method} "
-                    f"{request_info.url} {code} "
-                    f"{request_info.user_agent}"
+                sending = time.perf_counter()
+                await self._send_response_async(writer, response)
+                self._metrics.observe("send", time.perf_counter() - sending)
+                self._log_request(request_info, response, started)
+            except asyncio.LimitOverrunError:
+                await self._send_response_async(
+                    writer, self._response_generator.generate_error_response(431)
                 )
-                self._mutex.release()
-
-                client.sendall(response)
-            except Exception as e:
-                if e.__class__ is not socket.timeout:
-                    self._mutex.acquire()
-                    logging.error("Server exception", exc_info=True)
-                    self._mutex.release()
+                break
+            except exc.BadRequestException:
+                await self._send_response_async(
+                    writer, self._response_generator.generate_error_response(400)
+                )
+                break
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                break
+            except Exception:
+                self._log_error()
                 break
 
-        client.close()
-        self._mutex.acquire()
-        self._active_connections[ip][0] -= 1
-        client_connections = self._active_connections[ip]
-        self._mutex.release()
+        writer.close()
+        self._unregister_client(ip)
         if self._debug:
             print(f"Client {address[0]}:{address[1]} disconnected")
 
-    def run(self):
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server_socket.bind((self._ip_address, self._port))
-        server_socket.listen(self._connections_limit)
+    async def _reject_async(self, reader, writer, response):
+        """Answers with a pre-encoded response once the request head has
+        arrived, so the client does not see a reset instead"""
+        try:
+            await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), self._keep_alive_timeout
+            )
+            writer.write(response)
+            await writer.drain()
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            asyncio.TimeoutError,
+            ConnectionError,
+        ):
+            pass
+
+    async def _reject_rate_limited_async(self, writer, request_info):
+        """Answers 429 to a rate limited request with a body without reading
+        it; the connection is closed after the response"""
+        try:
+            writer.write(self._encode_rejection(429, request_info.too_many_requests))
+            await writer.drain()
+            writer.write_eof()
+        except ConnectionError:
+            pass
+
+    def run(self, server_socket=None, reuse_port=False):
+        """Serves until stopped. SIGTERM stops the server like Ctrl+C, so
+        the media snapshot is saved on the way out."""
+        if current_thread() is main_thread():
+            signal.signal(signal.SIGTERM, self._handle_sigterm)
+        try:
+            self._serve_forever(server_socket, reuse_port)
+        finally:
+            self._file_manager.save_snapshot()
+
+    def _serve_forever(self, server_socket, reuse_port):
+        self._access_log.start()
+        self._rate_limiter.start()
+        if self._file_watcher is not None:
+            self._file_watcher.start()
+        if server_socket is None:
+            server_socket = create_server_socket(
+                self._ip_address,
+                self._port,
+                self._connections_limit,
+                reuse_port,
+            )
+        if self._server_mode == "asyncio":
+            asyncio.run(self.run_async(server_socket))
+            return
+
+        self._connection_manager = ConnectionManager(
+            server_socket,
+            self.open_connection,
+            self.serve_connection,
+            self.close_connection,
+            self._connections_limit,
+            self._work_queue_limit,
+            self._keep_alive_timeout,
+            self._busy_response,
+            self._metrics,
+            self._keep_alive_linger,
+        )
+        for lane in (self._dynamic_lane, self._upload_lane):
+            if lane is not None:
+                lane.start()
+        self._connection_manager.run()
+
+    def _handle_sigterm(self, signum, frame):
+        raise SystemExit(0)
+
+    async def run_async(self, server_socket):
+        with ThreadPoolExecutor(max_workers=self._async_file_workers) as executor:
+            self._file_executor = executor
+            server = await asyncio.start_server(
+                self._accept_async,
+                sock=server_socket,
+                backlog=self._connections_limit,
+                limit=self._header_size_limit,
+            )
+            async with server:
+                await server.serve_forever()
 
-        with ThreadPoolExecutor(max_workers=self._connections_limit) as executor:
+    async def _accept_async(self, reader, writer):
+        if self._keep_alive:
+            self._set_keepalive(writer.get_extra_info("socket"))
+        await self.handle_client_async(reader, writer)
+
+    def _receive_upload(self, reader, request_info):
+        """Streams exactly Content-Length bytes of a multipart body to disk"""
+        media_parser = self._parser.create_media_parser(request_info)
+        try:
+            for chunk in reader.iter_body(request_info.content_length or 0):
+                media_parser.feed(chunk)
+        finally:
+            media_parser.close()
+
+    async def _receive_upload_async(self, reader, request_info):
+        loop = asyncio.get_running_loop()
+        media_parser = self._parser.create_media_parser(request_info)
+        remaining = request_info.content_length or 0
+        try:
+            while remaining > 0:
+                chunk = await asyncio.wait_for(
+                    reader.read(min(self._request_size, remaining)),
+                    self._keep_alive_timeout,
+                )
+                if not chunk:
+                    break
+                await loop.run_in_executor(
+                    self._file_executor, media_parser.feed, chunk
+                )
+                remaining -= len(chunk)
+        finally:
+            media_parser.close()
+
+    def _send_response(self, client, response):
+        """Sends the head and in-memory parts with scatter/gather writes,
+        file ranges with sendfile and streamed bodies as chunks. A file that
+        shrank under a range aborts the connection, as its length is sent."""
+        buffers = response.buffers
+        for part in response.parts:
+            if not isinstance(part, FileRange):
+                buffers.append(part)
+                continue
+            self._send_buffers(client, buffers)
+            buffers = []
+            with open(part.path, "rb") as file:
+                sent = client.sendfile(file, part.offset, part.count)
+            if sent < part.count:
+                raise ConnectionAbortedError(f"{part.path} shrank while sent")
+        if response.chunks is not None:
+            for chunk in response.chunks:
+                if chunk:
+                    buffers += [b"%x\r\n" % len(chunk), chunk, b"\r\n"]
+                    self._send_buffers(client, buffers)
+                    buffers = []
+            buffers.append(b"0\r\n\r\n")
+        self._send_buffers(client, buffers)
+
+    def _send_buffers(self, client, buffers):
+        """Sends all buffers with scatter/gather writes instead of joining them"""
+        buffers = [memoryview(buffer) for buffer in buffers]
+        while buffers:
+            sent = client.sendmsg(buffers)
+            while sent:
+                if sent >= len(buffers[0]):
+                    sent -= len(buffers.pop(0))
+                else:
+                    buffers[0] = buffers[0][sent:]
+                    sent = 0
+
+    async def _send_response_async(self, writer, response):
+        loop = asyncio.get_running_loop()
+        writer.writelines(response.buffers)
+        for part in response.parts:
+            if not isinstance(part, FileRange):
+                writer.write(part)
+                continue
+            await writer.drain()
+            with open(part.path, "rb") as file:
+                sent = await loop.sendfile(
+                    writer.transport, file, part.offset, part.count
+                )
+            if sent < part.count:
+                raise ConnectionAbortedError(f"{part.path} shrank while sent")
+        if response.chunks is not None:
+            chunks = iter(response.chunks)
             while True:
-                client, address = server_socket.accept()
+                chunk = await loop.run_in_executor(
+                    self._file_executor, next, chunks, None
+                )
+                if chunk is None:
+                    break
+                if chunk:
+                    writer.writelines([b"%x\r\n" % len(chunk), chunk, b"\r\n"])
+                    await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
 
-                if self._keep_alive:
-                    self._set_keepalive(client)
-                executor.submit(self.handle_client, client, address)
+    def _encode_rejection(self, code, retry_after):
+        response = self._response_generator.generate_error_response(code, retry_after)
+        return b"".join(response.buffers)
+
+    def _send_error(self, client, code, retry_after=None):
+        """Sends a prebuilt error response before the connection is closed.
+        The client may already be gone, so send errors are ignored."""
+        try:
+            self._send_response(
+                client,
+                self._response_generator.generate_error_response(code, retry_after),
+            )
+        except OSError:
+            return
+        self._lingering_close(client)
+
+    def _lingering_close(self, client):
+        """Drains unread request bytes so the error response is not lost
+        to a connection reset. A client that keeps sending is cut off after
+        a second."""
+        deadline = time.monotonic() + 1
+        try:
+            client.shutdown(socket.SHUT_WR)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                client.settimeout(remaining)
+                if not client.recv(self._request_size):
+                    return
+        except OSError:
+            pass
 
     def _set_keepalive(self, sock, after_idle_sec=1, interval_sec=3, max_fails=5):
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
@@ -171,18 +631,129 @@ class Server:
         sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval_sec)
         sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, max_fails)
 
-    def _too_many_requests(self, requests):
-        while (
-            len(requests) > 0
-            and time.time() - requests[0] > self._too_many_requests_span
-        ):
-            requests.pop(0)
-        res = len(requests) > self._too_many_requests_limit
-        return res
+    def _register_client(self, ip):
+        self._metrics.inc(ACTIVE_CONNECTIONS)
+        connections = self._rate_limiter.connect(ip)
+        return connections > self._client_connections_limit
+
+    def _unregister_client(self, ip):
+        self._metrics.inc(ACTIVE_CONNECTIONS, -1)
+        self._rate_limiter.disconnect(ip)
+
+    def _prepare_request(self, head, address, requests_count):
+        parsing = time.perf_counter()
+        request_info = self._parser.parse_request(head)
+        self._metrics.observe("parse", time.perf_counter() - parsing)
+        request_info.too_many_requests = self._rate_limiter.check(address[0])
+        request_info.client = address[0]
+        request_info.requests_count = requests_count
+        return request_info
+
+    def _is_keep_alive(self, request_info):
+        return bool(request_info.connection) and request_info.method != "POST"
+
+    def _generate_response(self, request_info):
+        """Serves the metrics url without routing and times everything
+        else"""
+        if request_info.url == self._metrics_url:
+            return self._response_generator.generate_text_response(
+                request_info, METRICS_CONTENT_TYPE, self._render_metrics()
+            )
+        generating = time.perf_counter()
+        response, _ = self._response_generator.generate_response(request_info)
+        self._metrics.observe("generate", time.perf_counter() - generating)
+        return response
+
+    def _render_metrics(self):
+        extra = [
+            ("http_access_log_dropped_total", "counter", self._access_log.dropped),
+            ("http_rate_limiter_clients", "gauge", len(self._rate_limiter)),
+            ("http_receive_buffers_total", "counter", self._buffer_pool.created),
+            ("http_receive_buffers_free", "gauge", len(self._buffer_pool)),
+            ("http_receive_buffers_in_use", "gauge", self._buffer_pool.in_use),
+        ]
+        if self._connection_manager is not None:
+            manager = self._connection_manager
+            extra += [
+                ("http_pending_connections", "gauge", manager.pending),
+                ("http_rejected_connections_total", "counter", manager.rejected),
+            ]
+        for lane in (self._dynamic_lane, self._upload_lane):
+            if lane is not None:
+                extra.append(
+                    (f'http_lane_pending{{lane="{lane.name}"}}', "gauge", lane.pending)
+                )
+        extra.append(
+            ("http_upload_inflight_bytes", "gauge", self._upload_budget.in_flight)
+        )
+        if self._response_cache is not None:
+            stats = self._response_cache.stats()
+            extra += [
+                ("http_response_cache_hits_total", "counter", stats["hits"]),
+                ("http_response_cache_misses_total", "counter", stats["misses"]),
+                ("http_response_cache_evictions_total", "counter", stats["evictions"]),
+                ("http_response_cache_entries", "gauge", stats["entries"]),
+                ("http_response_cache_bytes", "gauge", stats["bytes"]),
+            ]
+        return self._metrics.render(extra)
+
+    def _log_request(self, request_info, response, started):
+        self._metrics.inc(f'{RESPONSES}{{code="{response.code}"}}')
+        self._metrics.inc(
+            SENT_BYTES,
+            len(response.head) + len(response.connection) + response.content_length,
+        )
+        self._access_log.log(
+            request_info,
+            response.code,
+            response.content_length,
+            time.perf_counter() - started,
+        )
+
+    def _log_error(self):
+        self._mutex.acquire()
+        logging.error("Server exception", exc_info=True)
+        self._mutex.release()
+
+
+def create_server_socket(ip_address, port, backlog, reuse_port=False):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.bind((ip_address, port))
+    server_socket.listen(backlog)
+    return server_socket
+
+
+def run_workers(config, workers_count):
+    """Forks workers_count servers, each with its own index and cache.
+    Workers either bind their own SO_REUSEPORT socket or inherit one
+    listening socket bound here."""
+    shared_socket = None
+    if config.get("reuse-port", "False") != "True":
+        shared_socket = create_server_socket(
+            config["ip-address"],
+            int(config["port"]),
+            int(config["connections-limit"]),
+        )
+
+    def start_worker(index):
+        server = Server(config, "a", rotate_access_log=index == 0)
+        server.run(shared_socket, reuse_port=shared_socket is None)
+
+    supervisor = WorkerSupervisor(
+        workers_count, start_worker, debug=config.get("debug") == "True"
+    )
+    supervisor.run()
 
 
 if __name__ == "__main__":
     configuration = configparser.ConfigParser()
     configuration.read("config.ini")
-    server = Server(configuration["SERVER"])
-    server.run()
+    workers = int(configuration["SERVER"].get("workers", 1))
+    if workers > 1:
+        run_workers(configuration["SERVER"], workers)
+    else:
+        server = Server(configuration["SERVER"])
+        server.run()
@@ -28,3 +28,35 @@ class BadRequestException(Exception):
 
     def __str__(self):
         return self.message
+
+
+class HeaderTooLargeException(Exception):
+    def __init__(self, limit):
+        self.message = f"Request headers exceed {limit} bytes"
+
+    def __str__(self):
+        return self.message
+
+
+class RequestTimeoutException(Exception):
+    def __init__(self):
+        self.message = "Request headers were not received in time"
+
+    def __str__(self):
+        return self.message
+
+
+class BufferPoolExhaustedException(Exception):
+    def __init__(self, limit):
+        self.message = f"Receive buffers in use exceed {limit} bytes"
+
+    def __str__(self):
+        return self.message
+
+
+class TemplateException(Exception):
+    def __init__(self, path, reason):
+        self.message = f"Could not compile template '{path}': {reason}"
+
+    def __str__(self):
+        return self.message
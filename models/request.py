@@ -1,26 +1,89 @@
+from urllib.parse import parse_qsl
+
+
 class Request:
+    __slots__ = (
+        "method",
+        "url",
+        "http_version",
+        "query_string",
+        "_page_name",
+        "_query",
+        "connection",
+        "content_length",
+        "content_type",
+        "user_agent",
+        "if_none_match",
+        "if_modified_since",
+        "encoding",
+        "range",
+        "if_range",
+        "client",
+        "requests_count",
+        "request_body",
+        "login_body",
+        "too_many_requests",
+    )
+
     def __init__(
         self,
         method,
         url,
         http_version,
-        page_name,
+        page_name=None,
+        query=None,
         connection=None,
         content_length=None,
+        content_type=None,
         user_agent=None,
+        if_none_match=None,
+        if_modified_since=None,
+        encoding=None,
+        range=None,
+        if_range=None,
         client=None,
         requests_count=None,
         request_body=None,
         too_many_requests=None,
+        query_string="",
     ):
         self.method = method
         self.url = url
-        self.page_name = page_name
         self.http_version = http_version
+        self.query_string = query_string
+        self._page_name = page_name
+        self._query = query
         self.connection = connection
         self.content_length = content_length
+        self.content_type = content_type
         self.user_agent = user_agent
+        self.if_none_match = if_none_match
+        self.if_modified_since = if_modified_since
+        self.encoding = encoding
+        self.range = range
+        self.if_range = if_range
         self.client = client
         self.requests_count = requests_count
         self.request_body = request_body
-        self.too_many_requests = request_body
+        self.login_body = None
+        self.too_many_requests = too_many_requests
+
+    @property
+    def page_name(self):
+        if self._page_name is None:
+            self._page_name = self.url.rstrip("/").rpartition("/")[2]
+        return self._page_name
+
+    @page_name.setter
+    def page_name(self, value):
+        self._page_name = value
+
+    @property
+    def query(self):
+        if self._query is None:
+            self._query = dict(parse_qsl(self.query_string))
+        return self._query
+
+    @query.setter
+    def query(self, value):
+        self._query = value
@@ -0,0 +1,28 @@
+class FileRange:
+    def __init__(self, path, offset, count):
+        self.path = path
+        self.offset = offset
+        self.count = count
+
+
+class Response:
+    def __init__(
+        self, code, head, body=b"", parts=(), connection=b"", chunks=None
+    ):
+        self.code = code
+        self.head = head
+        self.body = body
+        self.parts = parts
+        self.connection = connection
+        self.chunks = chunks
+
+    @property
+    def buffers(self):
+        return [buffer for buffer in (self.head, self.connection, self.body) if buffer]
+
+    @property
+    def content_length(self):
+        length = len(self.body)
+        for part in self.parts:
+            length += part.count if isinstance(part, FileRange) else len(part)
+        return length
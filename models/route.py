@@ -0,0 +1,116 @@
+from email.utils import formatdate
+
+
+class Route:
+    def __init__(
+        self,
+        url,
+        path,
+        size,
+        content_type,
+        cache_control,
+        dynamic=False,
+        mtime=0,
+        inode=0,
+        compressible=False,
+        media=False,
+        template=None,
+        immutable=False,
+        canonical_url=None,
+    ):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.dynamic = dynamic
+        self.mtime = mtime
+        self.inode = inode
+        self.compressible = compressible
+        self.media = media
+        self.template = template
+        self.immutable = immutable
+        self.canonical_url = canonical_url
+        self.etag = f'"{inode:x}-{int(mtime * 1000000):x}-{size:x}"'
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.header = self._build_header()
+        self.not_modified_header = self.build_not_modified_header(self.etag)
+
+    def refresh(self, size, mtime, inode):
+        """Returns a route for the file as it is now, or self when it has not
+        changed since it was indexed. Headers carry the indexed length, so a
+        file edited in place must not be sent with them."""
+        if size == self.size and mtime == self.mtime and inode == self.inode:
+            return self
+        return Route(
+            self.url,
+            self.path,
+            size,
+            self.content_type,
+            self.cache_control,
+            self.dynamic,
+            mtime,
+            inode,
+            self.compressible,
+            self.media,
+            self.template,
+            self.immutable,
+            self.canonical_url,
+        )
+
+    def get_etag(self, encoding=None):
+        if encoding is None:
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+    def build_encoded_header(self, encoding, length):
+        return (
+            "HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {self.content_type}\r\n"
+            f"Cache-Control: {self.cache_control}\r\n"
+            "Vary: Accept-Encoding\r\n"
+            f"Content-Encoding: {encoding}\r\n"
+            f"ETag: {self.get_etag(encoding)}\r\n"
+            f"Last-Modified: {self.last_modified}\r\n"
+            f"Content-Length: {length}\r\n"
+        ).encode("utf-8")
+
+    def build_partial_header(self, content_type, content_range, length):
+        return (
+            "HTTP/1.1 206 Partial Content\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Cache-Control: {self.cache_control}\r\n"
+            "Accept-Ranges: bytes\r\n"
+            f"ETag: {self.etag}\r\n"
+            f"Last-Modified: {self.last_modified}\r\n"
+            f"{content_range}"
+            f"Content-Length: {length}\r\n"
+        ).encode("utf-8")
+
+    def build_not_modified_header(self, etag):
+        header = (
+            "HTTP/1.1 304 Not Modified\r\n"
+            f"Cache-Control: {self.cache_control}\r\n"
+        )
+        if self.compressible:
+            header += "Vary: Accept-Encoding\r\n"
+        header += f"ETag: {etag}\r\nLast-Modified: {self.last_modified}\r\n"
+        return header.encode("utf-8")
+
+    def _build_header(self):
+        header = (
+            "HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {self.content_type}\r\n"
+            f"Cache-Control: {self.cache_control}\r\n"
+        )
+        if self.compressible:
+            header += "Vary: Accept-Encoding\r\n"
+        if self.media:
+            header += "Accept-Ranges: bytes\r\n"
+        if not self.dynamic:
+            header += (
+                f"ETag: {self.etag}\r\n"
+                f"Last-Modified: {self.last_modified}\r\n"
+                f"Content-Length: {self.size}\r\n"
+            )
+        return header.encode("utf-8")
@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from models.request import Request
+from utils.access_log import AccessLog
+
+
+class TestAccessLog(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "access.log")
+        self.request = Request("GET", "/index", "HTTP/1.1", "index")
+        self.request.client = "127.0.0.1"
+        self.request.user_agent = "TestAgent"
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read(self, path=None):
+        with open(path or self.path) as f:
+            return f.read().splitlines()
+
+    def test_common_format(self):
+        access_log = AccessLog(self.path, log_format="common-us")
+        access_log.log(self.request, 200, 13, 0.0015)
+        access_log.stop()
+        line = self.read()[0]
+        self.assertTrue(line.startswith("127.0.0.1 - - ["))
+        self.assertTrue(line.endswith('] "GET /index HTTP/1.1" 200 13 1500'))
+
+    def test_json_format(self):
+        access_log = AccessLog(self.path, log_format="json")
+        access_log.log(self.request, 404, 0, 0.000002)
+        access_log.stop()
+        record = json.loads(self.read()[0])
+        self.assertEqual(record["status"], 404)
+        self.assertEqual(record["url"], "/index")
+        self.assertEqual(record["duration_us"], 2)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            AccessLog(self.path, log_format="xml")
+
+    def test_full_queue_drops_records(self):
+        access_log = AccessLog(self.path, queue_size=2)
+        results = [access_log.log(self.request, 200, 1, 0) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(access_log.dropped, 1)
+        access_log.stop()
+        self.assertEqual(len(self.read()), 2)
+
+    def test_writer_thread(self):
+        access_log = AccessLog(self.path, flush_interval=0.01)
+        access_log.start()
+        access_log.log(self.request, 200, 1, 0)
+        access_log.stop()
+        self.assertEqual(len(self.read()), 1)
+
+    def test_rotation_by_size(self):
+        access_log = AccessLog(self.path, max_bytes=1, backup_count=2)
+        for _ in range(3):
+            access_log.log(self.request, 200, 1, 0)
+            access_log.flush()
+            access_log._rotate_if_needed()
+        access_log.stop()
+        self.assertEqual(self.read(), [])
+        self.assertEqual(len(self.read(self.path + ".1")), 1)
+        self.assertEqual(len(self.read(self.path + ".2")), 1)
+        self.assertFalse(os.path.exists(self.path + ".3"))
+
+    def test_rotation_with_several_writers(self):
+        rotating = AccessLog(self.path, "a", max_bytes=1, backup_count=2)
+        follower = AccessLog(self.path, "a", max_bytes=1, rotate=False)
+        follower.log(self.request, 200, 1, 0)
+        follower.flush()
+        rotating.log(self.request, 200, 1, 0)
+        rotating.flush()
+        rotating._rotate_if_needed()
+        follower._rotate_if_needed()
+        follower.log(self.request, 200, 1, 0)
+        follower.flush()
+        rotating.stop()
+        follower.stop()
+        self.assertEqual(len(self.read(self.path + ".1")), 2)
+        self.assertEqual(len(self.read()), 1)
+        self.assertFalse(os.path.exists(self.path + ".2"))
+
+    def test_writer_thread_survives_write_errors(self):
+        access_log = AccessLog(self.path, flush_interval=0.01)
+        deadline = time.monotonic() + 5
+        with patch.object(
+            access_log, "_rotate_if_needed", side_effect=OSError
+        ), self.assertLogs(level="ERROR") as logs:
+            access_log.start()
+            for count in (1, 2):
+                access_log.log(self.request, 200, 1, 0)
+                while len(logs.records) < count and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            self.assertEqual(len(logs.records), 2)
+            self.assertTrue(access_log._thread.is_alive())
+        access_log.stop()
+        self.assertEqual(len(self.read()), 2)
+
+if __name__ == "__main__":
+    unittest.main()
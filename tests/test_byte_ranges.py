@@ -0,0 +1,34 @@
+import unittest
+
+from utils.byte_ranges import parse_range
+
+
+class TestByteRanges(unittest.TestCase):
+
+    def test_single_range(self):
+        self.assertEqual(parse_range("bytes=0-99", 1000), [(0, 99)])
+        self.assertEqual(parse_range("bytes=900-", 1000), [(900, 999)])
+        self.assertEqual(parse_range("bytes=900-5000", 1000), [(900, 999)])
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range("bytes=-100", 1000), [(900, 999)])
+        self.assertEqual(parse_range("bytes=-5000", 1000), [(0, 999)])
+
+    def test_multiple_ranges(self):
+        self.assertEqual(
+            parse_range("bytes=0-9, 20-29,-5", 100), [(0, 9), (20, 29), (95, 99)]
+        )
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range("bytes=1000-", 1000), [])
+        self.assertEqual(parse_range("bytes=-0", 1000), [])
+
+    def test_invalid(self):
+        self.assertIsNone(parse_range("items=0-1", 1000))
+        self.assertIsNone(parse_range("bytes=5-1", 1000))
+        self.assertIsNone(parse_range("bytes=a-b", 1000))
+        self.assertIsNone(parse_range("bytes=" + ",".join(["0-1"] * 17), 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import gzip
+import zlib
+import unittest
+
+from utils.compression import compress_stream, is_compressible, negotiate_encoding
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding("gzip, deflate, br, zstd"), "gzip")
+        self.assertEqual(negotiate_encoding("deflate;q=1, gzip;q=0.5"), "deflate")
+        self.assertEqual(negotiate_encoding("*"), "gzip")
+        self.assertIsNone(negotiate_encoding("gzip;q=0"))
+        self.assertIsNone(negotiate_encoding("br, identity"))
+
+    def test_is_compressible(self):
+        self.assertTrue(is_compressible("text/html"))
+        self.assertTrue(is_compressible("application/json"))
+        self.assertFalse(is_compressible("image/jpeg"))
+
+    def test_compress_stream(self):
+        chunks = [b"<p>text</p>" * 100, b"", b"end"]
+        data = b"".join(compress_stream(iter(chunks), "gzip"))
+        self.assertEqual(gzip.decompress(data), b"".join(chunks))
+        data = b"".join(compress_stream(iter(chunks), "deflate"))
+        self.assertEqual(zlib.decompress(data), b"".join(chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
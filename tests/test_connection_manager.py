@@ -0,0 +1,129 @@
+import socket
+import time
+import unittest
+from threading import Event, Thread
+
+from utils.connection_manager import Connection, ConnectionManager
+
+BUSY = b"HTTP/1.1 503 Service unavailable\r\n\r\n"
+
+
+class TestConnectionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.server_socket = socket.socket()
+        self.server_socket.bind(("127.0.0.1", 0))
+        self.server_socket.listen(16)
+        self.address = self.server_socket.getsockname()
+        self.served = []
+        self.closed = []
+        self.release = Event()
+        self.release.set()
+        self.clients = []
+
+    def tearDown(self):
+        self.release.set()
+        self.manager.stop()
+        self.thread.join(5)
+        self.server_socket.close()
+        for client in self.clients:
+            client.close()
+
+    def start(self, workers_count=2, queue_limit=10, idle_timeout=5, linger=0):
+        self.manager = ConnectionManager(
+            self.server_socket,
+            lambda sock, address: Connection(sock, address, keep_alive=True),
+            self.serve,
+            self.close,
+            workers_count,
+            queue_limit,
+            idle_timeout,
+            BUSY,
+            linger=linger,
+        )
+        self.thread = Thread(target=self.manager.run, daemon=True)
+        self.thread.start()
+
+    def serve(self, connection):
+        data = connection.sock.recv(1024)
+        if not data:
+            return False
+        self.release.wait(5)
+        self.served.append(data)
+        connection.sock.sendall(b"ok " + data)
+        return True
+
+    def close(self, connection):
+        self.closed.append(connection)
+        connection.sock.close()
+
+    def connect(self):
+        client = socket.create_connection(self.address, 5)
+        self.clients.append(client)
+        return client
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_parked_connection_served_when_readable(self):
+        self.start()
+        client = self.connect()
+        for data in (b"a", b"b"):
+            client.sendall(data)
+            self.assertEqual(client.recv(1024), b"ok " + data)
+        self.wait_for(lambda: self.manager.parked == 1)
+        self.assertEqual(self.served, [b"a", b"b"])
+
+    def test_busy_response_when_queue_is_full(self):
+        self.release.clear()
+        self.start(workers_count=1, queue_limit=1)
+        first, second, third = self.connect(), self.connect(), self.connect()
+        first.sendall(b"1")
+        self.wait_for(lambda: self.manager.pending == 0 and self.manager.parked == 2)
+        second.sendall(b"2")
+        self.wait_for(lambda: self.manager.pending == 1)
+        third.sendall(b"3")
+        self.assertEqual(third.recv(1024), BUSY)
+        self.assertEqual(self.manager.rejected, 1)
+        self.release.set()
+        self.assertEqual(first.recv(1024), b"ok 1")
+        self.assertEqual(second.recv(1024), b"ok 2")
+
+    def test_idle_connection_closed(self):
+        self.start(idle_timeout=0.1)
+        client = self.connect()
+        self.assertEqual(client.recv(1024), b"")
+        self.assertEqual(len(self.closed), 1)
+        self.assertEqual(self.manager.parked, 0)
+
+    def test_wait_readable(self):
+        self.start(linger=0.05)
+        server, client = socket.socketpair()
+        self.clients += [server, client]
+        connection = Connection(server, None)
+        self.assertFalse(self.manager.wait_readable(connection))
+        client.sendall(b"next")
+        self.assertTrue(self.manager.wait_readable(connection))
+
+    def test_partial_head_closed_at_its_deadline(self):
+        self.serve = self.serve_partial
+        self.start(idle_timeout=5)
+        slow, idle = self.connect(), self.connect()
+        slow.sendall(b"G")
+        self.assertEqual(slow.recv(1024), b"")
+        self.assertEqual(len(self.closed), 1)
+        self.assertEqual(self.manager.parked, 1)
+        idle.sendall(b"ET")
+        self.wait_for(lambda: len(self.closed) == 2)
+
+    def serve_partial(self, connection):
+        connection.sock.recv(1024)
+        if connection.head_deadline is None:
+            connection.head_deadline = time.monotonic() + 0.1
+        return True
+
+if __name__ == "__main__":
+    unittest.main()
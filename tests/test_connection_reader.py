@@ -0,0 +1,184 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from models.exceptions import (
+    BadRequestException,
+    BufferPoolExhaustedException,
+    HeaderTooLargeException,
+    RequestTimeoutException,
+)
+from utils.buffer_pool import BufferPool
+from utils.connection_reader import ConnectionReader
+
+
+def make_socket(*chunks):
+    """Socket whose recv_into returns chunks in order, split when the
+    buffer is smaller than the chunk. An exception in chunks is raised."""
+    sock = MagicMock()
+    pending = list(chunks)
+
+    def recv_into(buffer, nbytes=0):
+        if not pending:
+            return 0
+        nbytes = nbytes or len(buffer)
+        chunk = pending.pop(0)
+        if isinstance(chunk, Exception):
+            raise chunk
+        if len(chunk) > nbytes:
+            pending.insert(0, chunk[nbytes:])
+            chunk = chunk[:nbytes]
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    sock.recv_into.side_effect = recv_into
+    return sock
+
+
+class TestConnectionReader(unittest.TestCase):
+
+    def test_read_head_split_across_chunks(self):
+        sock = make_socket(b"GET / HTTP/1.1\r\nHo", b"st: x\r\n\r", b"\n")
+        reader = ConnectionReader(sock, 2048, 8192)
+        self.assertEqual(reader.read_head(), b"GET / HTTP/1.1\r\nHost: x")
+        self.assertIsNone(reader.read_head())
+
+    def test_pipelined_requests(self):
+        sock = make_socket(
+            b"GET /a HTTP/1.1\r\n\r\nPOST /b HTTP/1.1\r\nContent-Length: 4\r\n\r\n"
+            b"bodyGET /c HTTP/1.1\r\n\r\n"
+        )
+        reader = ConnectionReader(sock, 2048, 8192)
+        self.assertEqual(reader.read_head(), b"GET /a HTTP/1.1")
+        self.assertEqual(
+            reader.read_head(), b"POST /b HTTP/1.1\r\nContent-Length: 4"
+        )
+        self.assertEqual(reader.read_body(4), b"body")
+        self.assertEqual(reader.read_head(), b"GET /c HTTP/1.1")
+        self.assertEqual(sock.recv_into.call_count, 1)
+
+    def test_iter_body_reads_exact_length(self):
+        sock = make_socket(b"POST / HTTP/1.1\r\n\r\nab", b"cde")
+        reader = ConnectionReader(sock, 2048, 8192)
+        reader.read_head()
+        chunks = [bytes(chunk) for chunk in reader.iter_body(5)]
+        self.assertEqual(chunks, [b"ab", b"cde"])
+        self.assertEqual(sock.recv_into.call_args[0][1], 3)
+        self.assertEqual(reader.buffered, 0)
+
+    def test_read_body_across_several_receives(self):
+        sock = make_socket(
+            b"POST / HTTP/1.1\r\n\r\nname=", b"Ivan", b"&surname=", b"Ivanov"
+        )
+        reader = ConnectionReader(sock, 2048, 8192)
+        reader.read_head()
+        self.assertEqual(reader.read_body(24), b"name=Ivan&surname=Ivanov")
+
+    def test_header_size_limit(self):
+        sock = make_socket(b"GET / HTTP/1.1\r\n", b"X: " + b"a" * 100)
+        reader = ConnectionReader(sock, 2048, 64)
+        with self.assertRaises(HeaderTooLargeException):
+            reader.read_head()
+
+    def test_truncated_body(self):
+        sock = make_socket(b"POST / HTTP/1.1\r\n\r\nab")
+        reader = ConnectionReader(sock, 2048, 8192)
+        reader.read_head()
+        with self.assertRaises(BadRequestException):
+            reader.read_body(10)
+
+    def test_head_moved_to_front_of_full_buffer(self):
+        first = b"GET /a HTTP/1.1\r\n\r\n"
+        second = b"GET /b HTTP/1.1\r\nHost: " + b"x" * 30 + b"\r\n\r\n"
+        sock = make_socket(first + second[:20], second[20:])
+        reader = ConnectionReader(sock, 0, 60)
+        self.assertEqual(reader.read_head(), first[:-4])
+        self.assertEqual(reader.read_head(), second[:-4])
+        self.assertIsNone(reader.read_head())
+
+    def test_buffer_returned_to_pool_between_requests(self):
+        pool = BufferPool(8196, 8196)
+        sock = make_socket(b"GET /a HTTP/1.1\r\n\r\n", b"GET /b HTTP/1.1\r\n\r\n")
+        reader = ConnectionReader(sock, 2048, 8192, pool)
+        self.assertEqual(reader.read_head(), b"GET /a HTTP/1.1")
+        reader.close()
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(reader.read_head(), b"GET /b HTTP/1.1")
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.created, 1)
+
+    def test_buffer_with_unread_bytes_is_kept(self):
+        pool = BufferPool(8196, 8196)
+        sock = make_socket(b"GET /a HTTP/1.1\r\n\r\nGET")
+        reader = ConnectionReader(sock, 2048, 8192, pool)
+        reader.read_head()
+        reader.close()
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(reader.buffered, 3)
+
+    def test_discard_returns_buffer_with_unread_bytes(self):
+        pool = BufferPool(8196, 8196, 8196)
+        sock = make_socket(b"GET /a HTTP/1.1\r\n\r\nGET")
+        reader = ConnectionReader(sock, 2048, 8192, pool)
+        reader.read_head()
+        reader.close(discard=True)
+        self.assertEqual(reader.buffered, 0)
+        self.assertEqual((len(pool), pool.in_use), (1, 0))
+
+    def test_partial_head_without_wait(self):
+        sock = make_socket(
+            b"GET / HT", BlockingIOError(), b"TP/1.1\r\n\r\n", BlockingIOError()
+        )
+        reader = ConnectionReader(sock, 2048, 8192)
+        with self.assertRaises(BlockingIOError):
+            reader.read_head(wait=False)
+        started = reader.head_started
+        self.assertEqual(reader.buffered, 8)
+        self.assertEqual(reader.read_head(wait=False), b"GET / HTTP/1.1")
+        self.assertEqual(reader.head_started, started)
+        sock.settimeout.assert_called_with(0)
+        with self.assertRaises(BlockingIOError):
+            reader.read_head(wait=False)
+        self.assertIsNone(reader.head_started)
+
+    def test_head_deadline(self):
+        sock = make_socket(b"GET / HTTP/1.1\r\n")
+        reader = ConnectionReader(sock, 2048, 8192)
+        with self.assertRaises(RequestTimeoutException):
+            reader.read_head(time.monotonic() - 1)
+
+    def test_head_deadline_on_socket_timeout(self):
+        sock = make_socket(b"GET / HTTP/1.1\r\n")
+        reader = ConnectionReader(sock, 2048, 8192)
+        sock.recv_into.side_effect = [17, TimeoutError()]
+        with self.assertRaises(RequestTimeoutException):
+            reader.read_head(time.monotonic() + 10)
+
+
+class TestBufferPool(unittest.TestCase):
+
+    def test_memory_limit(self):
+        pool = BufferPool(1024, 2048)
+        buffers = [pool.acquire() for _ in range(3)]
+        for buffer in buffers:
+            pool.release(buffer)
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.created, 3)
+
+    def test_in_use_limit(self):
+        pool = BufferPool(1024, 4096, 2048)
+        first, second = pool.acquire(), pool.acquire()
+        with self.assertRaises(BufferPoolExhaustedException):
+            pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.in_use, 2)
+
+    def test_foreign_buffer_not_kept(self):
+        pool = BufferPool(1024, 4096)
+        pool.release(bytearray(10))
+        self.assertEqual(len(pool), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
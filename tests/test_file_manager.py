@@ -39,6 +39,15 @@ class TestFileManager(unittest.TestCase):
         non_existent_url = Path("/non_existent")
         self.assertFalse(self.file_manager.contains(non_existent_url))
 
+    def test_get_route(self):
+        route = self.file_manager.get_route("/")
+        self.assertEqual(route.path, Path(self.home_page_file))
+        self.assertEqual(route.size, len("<html></html>"))
+        self.assertEqual(route.content_type, "text/html")
+        self.assertTrue(route.header.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertIn(b"Content-Length: 13\r\n", route.header)
+        self.assertIsNone(self.file_manager.get_route("/non_existent"))
+
     def test_get_page_path_valid(self):
         url = Path("/")
         self.assertEqual(
@@ -80,15 +89,32 @@ class TestFileManager(unittest.TestCase):
             self.file_manager.path_starts_with(self.root_folder, self.media_folder)
         )
 
-    @patch("os.path.exists", return_value=False)
-    @patch("builtins.open", new_callable=mock_open)
-    def test_save_media(self, mock_file, mock_exists):
-        data = b'Content-Disposition: form-data; name="file"; filename="test.jpg"\r\n\r\nimage data'
-        self.file_manager.save_media(data)
+    def upload(self, filename, data):
+        file = self.file_manager.open_media_upload()
+        file.write(data)
+        return self.file_manager.commit_media_upload(file, filename)
+
+    def test_commit_media_upload(self):
+        file_path = self.upload("test.jpg", b"image data")
+        self.assertEqual(file_path, os.path.join(self.media_folder, "test.jpg"))
         self.assertIn(Path("/test.jpg"), self.file_manager.URLS)
-        mock_file.assert_called_once_with(
-            os.path.join(self.media_folder, "test.jpg"), "wb"
-        )
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(file_path).st_mode & 0o777, 0o666 & ~umask)
+        self.assertEqual(os.listdir(self.media_folder), ["test.jpg"])
+        os.remove(file_path)
+
+    def test_commit_media_upload_keeps_existing_file(self):
+        first = self.upload("test.jpg", b"first")
+        second = self.upload("test.jpg", b"second")
+        self.assertNotEqual(first, second)
+        with open(first, "rb") as f:
+            self.assertEqual(f.read(), b"first")
+        with open(second, "rb") as f:
+            self.assertEqual(f.read(), b"second")
+        self.assertEqual(len(os.listdir(self.media_folder)), 2)
+        os.remove(first)
+        os.remove(second)
 
     def test_get_media_links(self):
         file_path = os.path.join(self.media_folder, "image.jpg")
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from utils.file_manager import FileManager
+from utils.file_watcher import FileWatcher, InotifyBackend, PollingBackend
+from utils.response_cache import ResponseCache
+
+
+class TestFileWatcher(unittest.TestCase):
+
+    backend = "polling"
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.root_folder = os.path.join(self.folder, "root")
+        self.media_folder = os.path.join(self.folder, "media")
+        home_page_file = os.path.join(self.root_folder, "index.html")
+        os.makedirs(self.root_folder)
+        with open(home_page_file, "w") as f:
+            f.write("<html></html>")
+        self.file_manager = FileManager(
+            self.root_folder, home_page_file, self.media_folder
+        )
+        self.cache = ResponseCache(16, 1 << 16)
+        self.watcher = FileWatcher(
+            self.file_manager, self.cache, self.backend, interval=0.01
+        )
+
+    def tearDown(self):
+        self.watcher.stop()
+        shutil.rmtree(self.folder)
+
+    def write(self, path, data):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def test_new_file(self):
+        self.write(os.path.join(self.media_folder, "image.jpg"), b"image")
+        self.watcher.poll(0.2)
+        self.assertEqual(self.file_manager.get_route("/image.jpg").size, 5)
+
+    def test_changed_file_evicts_cache(self):
+        page = os.path.join(self.root_folder, "page.html")
+        self.write(page, b"old")
+        self.watcher.poll(0.2)
+        self.cache.put("/page", ("GET", 200, None), "old", 3)
+        self.write(page, b"new page")
+        self.watcher.poll(0.2)
+        self.assertEqual(self.file_manager.get_route("/page").size, 8)
+        self.assertIsNone(self.cache.get("/page", ("GET", 200, None)))
+
+    def test_removed_directory(self):
+        folder = os.path.join(self.media_folder, "album")
+        os.makedirs(folder)
+        self.write(os.path.join(folder, "a.jpg"), b"a")
+        self.watcher.poll(0.2)
+        self.assertTrue(self.file_manager.contains("/album/a.jpg"))
+        shutil.rmtree(folder)
+        self.watcher.poll(0.2)
+        self.assertFalse(self.file_manager.contains("/album/a.jpg"))
+
+
+    def wait_for(self, url):
+        deadline = time.monotonic() + 5
+        while not self.file_manager.contains(url) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.file_manager.contains(url)
+
+    def test_run_survives_index_errors(self):
+        with patch.object(
+            self.file_manager, "update_files", side_effect=OSError
+        ), self.assertLogs(level="ERROR"):
+            self.write(os.path.join(self.media_folder, "a.jpg"), b"a")
+            self.watcher.start()
+            self.assertTrue(self.wait_for("/a.jpg"))
+        self.write(os.path.join(self.media_folder, "b.jpg"), b"b")
+        self.assertTrue(self.wait_for("/b.jpg"))
+
+    def test_failed_backend_falls_back_to_polling(self):
+        self.write(os.path.join(self.media_folder, "a.jpg"), b"a")
+        with patch.object(
+            self.watcher.backend, "read", side_effect=OSError
+        ), self.assertLogs(level="ERROR"):
+            self.watcher.start()
+            self.assertTrue(self.wait_for("/a.jpg"))
+        self.assertIsInstance(self.watcher.backend, PollingBackend)
+        self.write(os.path.join(self.media_folder, "b.jpg"), b"b")
+        self.assertTrue(self.wait_for("/b.jpg"))
+
+class TestInotifyFileWatcher(TestFileWatcher):
+
+    backend = "inotify"
+
+    def test_backend(self):
+        self.assertIsInstance(self.watcher.backend, InotifyBackend)
+
+
+class TestPollingFileWatcher(unittest.TestCase):
+
+    def test_backend(self):
+        folder = tempfile.mkdtemp()
+        try:
+            backend = PollingBackend([folder])
+            with open(os.path.join(folder, "a"), "w") as f:
+                f.write("a")
+            changed, removed, _ = backend.read(0)
+            self.assertEqual(changed, {os.path.join(folder, "a")})
+            os.remove(os.path.join(folder, "a"))
+            changed, removed, _ = backend.read(0)
+            self.assertEqual(removed, {os.path.join(folder, "a")})
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    unittest.main()
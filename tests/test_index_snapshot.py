@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from utils.file_manager import FileManager
+from utils.index_snapshot import IndexSnapshot
+
+
+class TestIndexSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.media_folder = os.path.join(self.folder, "media")
+        self.snapshot_path = os.path.join(self.folder, "index.snapshot")
+        os.makedirs(os.path.join(self.media_folder, "album"))
+        self.write(os.path.join(self.media_folder, "image.jpg"), b"image")
+        self.write(os.path.join(self.media_folder, "album", "photo.png"), b"photo")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, path, data):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def scan(self):
+        snapshot = IndexSnapshot(self.snapshot_path)
+        snapshot.load()
+        files = snapshot.scan(self.media_folder)
+        snapshot.save()
+        return snapshot, {path: size for path, size, _, _ in files}
+
+    def snapshot_lists(self, name):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        _, files, _ = data["directories"][self.media_folder]
+        return any(file[0] == name for file in files)
+
+    def test_scan(self):
+        snapshot, files = self.scan()
+        self.assertEqual(snapshot.rescanned, 2)
+        self.assertEqual(
+            files,
+            {
+                os.path.join(self.media_folder, "image.jpg"): 5,
+                os.path.join(self.media_folder, "album", "photo.png"): 5,
+            },
+        )
+
+    def test_unchanged_directories_are_not_read(self):
+        self.scan()
+        with patch("os.scandir") as scandir:
+            snapshot, files = self.scan()
+        scandir.assert_not_called()
+        self.assertEqual(snapshot.rescanned, 0)
+        self.assertEqual(len(files), 2)
+
+    def test_changed_directory_is_rescanned(self):
+        self.scan()
+        os.remove(os.path.join(self.media_folder, "image.jpg"))
+        self.write(os.path.join(self.media_folder, "new.jpg"), b"new image")
+        os.utime(self.media_folder, ns=(0, 1))
+        snapshot, files = self.scan()
+        self.assertEqual(snapshot.rescanned, 1)
+        self.assertEqual(files[os.path.join(self.media_folder, "new.jpg")], 9)
+        self.assertNotIn(os.path.join(self.media_folder, "image.jpg"), files)
+
+    def test_rescanned_directory_stats_known_files(self):
+        self.scan()
+        self.write(os.path.join(self.media_folder, "image.jpg"), b"edited image")
+        self.write(os.path.join(self.media_folder, "new.jpg"), b"new image")
+        os.utime(self.media_folder, ns=(0, 1))
+        _, files = self.scan()
+        self.assertEqual(files[os.path.join(self.media_folder, "image.jpg")], 12)
+
+    def test_broken_snapshot_is_ignored(self):
+        self.write(self.snapshot_path, b"broken")
+        snapshot, files = self.scan()
+        self.assertEqual(snapshot.rescanned, 2)
+        self.assertEqual(len(files), 2)
+
+    def test_file_manager_uses_snapshot(self):
+        root_folder = os.path.join(self.folder, "root")
+        home_page_file = os.path.join(root_folder, "index.html")
+        os.makedirs(root_folder)
+        self.write(home_page_file, b"<html></html>")
+        FileManager(
+            root_folder, home_page_file, self.media_folder, True, self.snapshot_path
+        )
+        self.assertTrue(os.path.exists(self.snapshot_path))
+        file_manager = FileManager(
+            root_folder, home_page_file, self.media_folder, True, self.snapshot_path
+        )
+        route = file_manager.get_route("/album/photo.png")
+        self.assertEqual(route.size, 5)
+        self.assertTrue(route.media)
+        self.assertIn(Path("/image.jpg"), file_manager.get_media_links())
+        self.assertNotIn(Path("/"), file_manager.get_media_links())
+
+    def test_snapshot_is_json(self):
+        self.scan()
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(data["version"], 2)
+        self.assertIn(self.media_folder, data["directories"])
+
+    def test_media_changes_are_saved(self):
+        root_folder = os.path.join(self.folder, "root")
+        home_page_file = os.path.join(root_folder, "index.html")
+        os.makedirs(root_folder)
+        self.write(home_page_file, b"<html></html>")
+        file_manager = FileManager(
+            root_folder,
+            home_page_file,
+            self.media_folder,
+            snapshot_path=self.snapshot_path,
+            snapshot_save_delay=0.01,
+        )
+        file = file_manager.open_media_upload()
+        file.write(b"upload")
+        file_manager.commit_media_upload(file, "new.jpg")
+        deadline = time.monotonic() + 5
+        while not self.snapshot_lists("new.jpg") and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        with patch("os.scandir") as scandir:
+            snapshot, files = self.scan()
+        scandir.assert_not_called()
+        self.assertEqual(files[os.path.join(self.media_folder, "new.jpg")], 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
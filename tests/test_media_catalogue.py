@@ -0,0 +1,41 @@
+import unittest
+
+from utils.media_catalogue import MediaCatalogue
+
+
+class TestMediaCatalogue(unittest.TestCase):
+
+    def setUp(self):
+        self.catalogue = MediaCatalogue(["/c.jpg", "/a.jpg", "/album/b.jpg"])
+
+    def test_sorted(self):
+        self.assertEqual(list(self.catalogue), ["/a.jpg", "/album/b.jpg", "/c.jpg"])
+
+    def test_update(self):
+        version = self.catalogue.version
+        self.catalogue.update(added=["/b.jpg"], removed=["/c.jpg"])
+        self.assertEqual(list(self.catalogue), ["/a.jpg", "/album/b.jpg", "/b.jpg"])
+        self.assertGreater(self.catalogue.version, version)
+
+    def test_update_without_changes_keeps_version(self):
+        version = self.catalogue.version
+        self.catalogue.update(added=["/a.jpg"], removed=["/missing.jpg"])
+        self.assertEqual(self.catalogue.version, version)
+        self.assertEqual(len(self.catalogue), 3)
+
+    def test_page(self):
+        _, total, urls = self.catalogue.page(offset=1, limit=1)
+        self.assertEqual(total, 3)
+        self.assertEqual(urls, ["/album/b.jpg"])
+
+    def test_page_with_prefix(self):
+        _, total, urls = self.catalogue.page("/al")
+        self.assertEqual(total, 1)
+        self.assertEqual(urls, ["/album/b.jpg"])
+        _, total, urls = self.catalogue.page("/a", offset=5)
+        self.assertEqual(total, 2)
+        self.assertEqual(urls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
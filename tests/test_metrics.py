@@ -0,0 +1,64 @@
+import unittest
+from threading import Thread
+
+from utils.metrics import ACTIVE_CONNECTIONS, RESPONSES, Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.001, 0.01))
+
+    def test_histogram(self):
+        self.metrics.observe("parse", 0.0005)
+        self.metrics.observe("parse", 0.001)
+        self.metrics.observe("parse", 0.005)
+        self.metrics.observe("parse", 1)
+        _, histograms = self.metrics.collect()
+        self.assertEqual(histograms["parse"][1:], [2, 1, 1])
+        self.assertAlmostEqual(histograms["parse"][0], 1.0065)
+
+    def test_values_are_summed_over_threads(self):
+        def work():
+            for _ in range(100):
+                self.metrics.inc(ACTIVE_CONNECTIONS)
+                self.metrics.observe("send", 0.002)
+
+        threads = [Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.metrics.inc(ACTIVE_CONNECTIONS, -10)
+        counters, histograms = self.metrics.collect()
+        self.assertEqual(counters[ACTIVE_CONNECTIONS], 390)
+        self.assertEqual(histograms["send"][2], 400)
+
+    def test_render(self):
+        self.metrics.observe("recv", 0.005)
+        self.metrics.inc(f'{RESPONSES}{{code="404"}}')
+        text = self.metrics.render([("cache_hits_total", "counter", 3)]).decode()
+        self.assertIn('http_stage_duration_seconds_bucket{stage="recv",le="0.001"} 0', text)
+        self.assertIn('http_stage_duration_seconds_bucket{stage="recv",le="0.01"} 1', text)
+        self.assertIn('http_stage_duration_seconds_bucket{stage="recv",le="+Inf"} 1', text)
+        self.assertIn('http_stage_duration_seconds_count{stage="recv"} 1', text)
+        self.assertIn("# TYPE http_responses_total counter", text)
+        self.assertIn('http_responses_total{code="404"} 1', text)
+        self.assertIn("# TYPE http_connections_active gauge", text)
+        self.assertIn("http_connections_active 0", text)
+        self.assertIn("cache_hits_total 3", text)
+
+    def test_render_extra_with_labels(self):
+        text = self.metrics.render(
+            [
+                ('lane_pending{lane="dynamic"}', "gauge", 2),
+                ('lane_pending{lane="upload"}', "gauge", 1),
+            ]
+        ).decode()
+        self.assertEqual(text.count("# TYPE lane_pending gauge"), 1)
+        self.assertIn('lane_pending{lane="dynamic"} 2', text)
+        self.assertIn('lane_pending{lane="upload"} 1', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from models.exceptions import BadRequestException
+from utils.file_manager import FileManager
+from utils.multipart_parser import MultipartParser, parse_boundary
+
+
+class TestMultipartParser(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.root_folder = os.path.join(self.folder, "root")
+        self.media_folder = os.path.join(self.folder, "media")
+        self.home_page_file = os.path.join(self.root_folder, "home.html")
+        os.makedirs(self.root_folder)
+        with open(self.home_page_file, "w") as f:
+            f.write("<html></html>")
+        self.file_manager = FileManager(
+            self.root_folder, self.home_page_file, self.media_folder
+        )
+        self.image = b"\x00\xff\r\n\r\n--bound\r\n" * 100
+        self.body = (
+            b"--boundary\r\n"
+            b'Content-Disposition: form-data; name="file"; filename="test.jpg"\r\n'
+            b"Content-Type: image/jpeg\r\n\r\n"
+            + self.image
+            + b"\r\n--boundary\r\n"
+            b'Content-Disposition: form-data; name="submit"\r\n\r\n'
+            b"Upload Image\r\n--boundary--\r\n"
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def feed_by(self, parser, size):
+        for i in range(0, len(self.body), size):
+            parser.feed(self.body[i : i + size])
+
+    def test_feed_whole_body(self):
+        parser = MultipartParser(b"boundary", self.file_manager)
+        parser.feed(self.body)
+        self.assertTrue(parser.done)
+        self.assertEqual(len(parser.saved), 1)
+        with open(parser.saved[0], "rb") as f:
+            self.assertEqual(f.read(), self.image)
+        self.assertIn(Path("/test.jpg"), self.file_manager.URLS)
+
+    def test_feed_small_chunks(self):
+        for size in (1, 7, 64):
+            parser = MultipartParser(b"boundary", self.file_manager)
+            self.feed_by(parser, size)
+            self.assertTrue(parser.done)
+            with open(parser.saved[0], "rb") as f:
+                self.assertEqual(f.read(), self.image)
+
+    def test_unfinished_upload_is_discarded(self):
+        parser = MultipartParser(b"boundary", self.file_manager)
+        parser.feed(self.body[:200])
+        parser.close()
+        self.assertFalse(parser.done)
+        self.assertEqual(os.listdir(self.media_folder), [])
+
+    def test_content_addressed_storage(self):
+        self.file_manager.content_addressed = True
+        digest = hashlib.sha256(self.image).hexdigest()
+        for _ in range(2):
+            parser = MultipartParser(b"boundary", self.file_manager)
+            self.feed_by(parser, 64)
+        other = self.body.replace(b"test.jpg", b"copy.JPG")
+        parser = MultipartParser(b"boundary", self.file_manager)
+        parser.feed(other)
+
+        objects_folder = os.path.join(self.media_folder, "objects")
+        self.assertEqual(os.listdir(objects_folder), [f"{digest}.jpg"])
+        self.assertEqual(len(os.listdir(self.media_folder)), 3)
+        link = os.path.join(self.media_folder, "copy.JPG")
+        self.assertEqual(os.readlink(link), f"objects/{digest}.jpg")
+        with open(link, "rb") as f:
+            self.assertEqual(f.read(), self.image)
+
+        route = self.file_manager.get_route(f"/objects/{digest}.jpg")
+        self.assertTrue(route.immutable)
+        self.assertIn(b"Cache-Control: public, max-age=31536000, immutable", route.header)
+        alias = self.file_manager.get_route("/test.jpg")
+        self.assertFalse(alias.immutable)
+        self.assertEqual(alias.canonical_url, f"/objects/{digest}.jpg")
+        self.assertEqual(list(self.file_manager.media_catalogue), ["/copy.JPG", "/test.jpg"])
+
+    def test_client_file_named_by_digest_is_not_an_object(self):
+        self.file_manager.content_addressed = True
+        digest = hashlib.sha256(self.image).hexdigest()
+        forged = self.body.replace(self.image, b"forged").replace(
+            b"test.jpg", f"{digest}.jpg".encode()
+        )
+        MultipartParser(b"boundary", self.file_manager).feed(forged)
+        MultipartParser(b"boundary", self.file_manager).feed(self.body)
+
+        self.assertFalse(self.file_manager.get_route(f"/{digest}.jpg").immutable)
+        link = os.path.join(self.media_folder, "test.jpg")
+        with open(link, "rb") as f:
+            self.assertEqual(f.read(), self.image)
+
+    def test_changed_object_is_replaced(self):
+        self.file_manager.content_addressed = True
+        digest = hashlib.sha256(self.image).hexdigest()
+        object_path = os.path.join(self.media_folder, "objects", f"{digest}.jpg")
+        MultipartParser(b"boundary", self.file_manager).feed(self.body)
+        os.remove(object_path)
+        with open(object_path, "wb") as f:
+            f.write(b"changed")
+        other = self.body.replace(b"test.jpg", b"copy.jpg")
+        MultipartParser(b"boundary", self.file_manager).feed(other)
+
+        with open(object_path, "rb") as f:
+            self.assertEqual(f.read(), self.image)
+
+    def test_parse_boundary(self):
+        self.assertEqual(
+            parse_boundary('multipart/form-data; boundary="abc"'), b"abc"
+        )
+        with self.assertRaises(BadRequestException):
+            parse_boundary("application/x-www-form-urlencoded")
+
+
+if __name__ == "__main__":
+    unittest.main()
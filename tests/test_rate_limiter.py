@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import patch
+
+from utils.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch("time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sliding_window(self):
+        limiter = RateLimiter(3, 10)
+        self.assertEqual([limiter.check("a") for _ in range(3)], [0, 0, 0])
+        self.assertEqual(limiter.check("a"), 10)
+        self.assertEqual(limiter.check("b"), 0)
+
+    def test_sliding_window_weights_previous_window(self):
+        limiter = RateLimiter(4, 10)
+        for _ in range(4):
+            limiter.check("a")
+        self.now += 15
+        self.assertEqual(limiter.check("a"), 0)
+        self.assertEqual(limiter.check("a"), 0)
+        self.assertGreater(limiter.check("a"), 0)
+        self.now += 30
+        self.assertEqual(limiter.check("a"), 0)
+
+    def test_token_bucket(self):
+        limiter = RateLimiter(2, 10, "token-bucket")
+        self.assertEqual(limiter.check("a"), 0)
+        self.assertEqual(limiter.check("a"), 0)
+        self.assertEqual(limiter.check("a"), 5)
+        self.now += 5
+        self.assertEqual(limiter.check("a"), 0)
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            RateLimiter(2, 10, "fixed")
+
+    def test_connections(self):
+        limiter = RateLimiter(2, 10)
+        self.assertEqual(limiter.connect("a"), 1)
+        self.assertEqual(limiter.connect("a"), 2)
+        limiter.disconnect("a")
+        self.assertEqual(limiter.connect("a"), 2)
+
+    def test_evict_idle_clients(self):
+        limiter = RateLimiter(2, 10, idle_timeout=60)
+        limiter.connect("a")
+        limiter.connect("b")
+        limiter.disconnect("b")
+        limiter.check("c")
+        self.now += 61
+        limiter.evict()
+        self.assertEqual(len(limiter), 1)
+        self.assertEqual(limiter.connect("a"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
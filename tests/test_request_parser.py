@@ -1,5 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
+from models.exceptions import BadRequestException
+from models.request import Request
 from utils.request_parser import RequestParser
 
 
@@ -21,13 +23,49 @@ class TestRequestParser(unittest.TestCase):
         self.assertEqual(request.content_length, 123)
         self.assertEqual(request.user_agent, "TestAgent")
 
-    def test_parse_request_body_with_image(self):
-        request_info = MagicMock()
-        request_info.page_name = "uploaded_image"
-        body = b'--boundary\r\nContent-Disposition: form-data; name="file"; filename="test.jpg"\r\n\r\nimage data\r\n--boundary--'
+    def test_parse_conditional_headers(self):
+        data = (
+            'GET /index HTTP/1.1\r\nIf-None-Match: "abc"\r\n'
+            "If-Modified-Since: Thu, 01 Jan 1970 00:00:00 GMT\r\n"
+        )
+        request = self.parser.parse_request(data)
 
-        self.parser.parse_request_body(request_info, body)
-        self.file_manager.save_media.assert_called_once_with(body)
+        self.assertEqual(request.if_none_match, '"abc"')
+        self.assertEqual(request.if_modified_since, "Thu, 01 Jan 1970 00:00:00 GMT")
+
+    def test_parse_query(self):
+        data = "GET /download?page=2&prefix=%2Falbum HTTP/1.1\r\n"
+        request = self.parser.parse_request(data)
+
+        self.assertEqual(request.url, "/download")
+        self.assertEqual(request.page_name, "download")
+        self.assertEqual(request.query, {"page": "2", "prefix": "/album"})
+
+    def test_parse_bytes_and_memoryview(self):
+        data = b"GET /media/a.jpg HTTP/1.1\r\nconnection: keep-alive\r\nX-Other: 1\r\n"
+        for value in (data, memoryview(bytearray(data))):
+            request = self.parser.parse_request(value)
+
+            self.assertEqual(request.url, "/media/a.jpg")
+            self.assertEqual(request.page_name, "a.jpg")
+            self.assertEqual(request.connection, "keep-alive")
+            self.assertIsNone(request.too_many_requests)
+
+    def test_malformed_request(self):
+        for data in (
+            b"GARBAGE\r\n",
+            b"GET / HTTP/1.1\r\nno colon here\r\n",
+            b"POST / HTTP/1.1\r\nContent-Length: ten\r\n",
+            b"POST / HTTP/1.1\r\nContent-Length: -1\r\n",
+        ):
+            with self.assertRaises(BadRequestException):
+                self.parser.parse_request(data)
+
+    def test_request_has_slots(self):
+        request = Request("GET", "/", "HTTP/1.1")
+
+        with self.assertRaises(AttributeError):
+            request.unknown = 1
 
     def test_parse_request_body_with_login(self):
         request_info = MagicMock()
@@ -46,6 +84,14 @@ class TestRequestParser(unittest.TestCase):
         self.parser.parse_request_body(request_info, body)
         self.assertFalse(request_info.login_body)
 
+    def test_parse_request_body_with_malformed_login(self):
+        request_info = MagicMock()
+        request_info.page_name = "logger_name"
+
+        for body in ("name", "name=John", "name=John&surname", "a=b=c"):
+            with self.assertRaises(BadRequestException):
+                self.parser.parse_request_body(request_info, body)
+
 
 if __name__ == "__main__":
     unittest.main()
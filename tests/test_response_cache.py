@@ -0,0 +1,61 @@
+import time
+import unittest
+
+from utils.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(4, 100, shards_count=1)
+
+    def test_get_miss_and_hit(self):
+        self.assertIsNone(self.cache.get("/", ("GET", 200)))
+        self.cache.put("/", ("GET", 200), "page", 10)
+        self.assertEqual(self.cache.get("/", ("GET", 200)), "page")
+        self.assertIsNone(self.cache.get("/", ("GET", 429)))
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_evict_by_entries(self):
+        for i in range(5):
+            self.cache.put(f"/{i}", ("GET", 200), i, 1)
+        self.assertIsNone(self.cache.get("/0", ("GET", 200)))
+        self.assertEqual(self.cache.get("/4", ("GET", 200)), 4)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_evict_by_bytes(self):
+        self.cache.put("/a", ("GET", 200), "a", 60)
+        self.cache.get("/a", ("GET", 200))
+        self.cache.put("/b", ("GET", 200), "b", 60)
+        self.assertIsNone(self.cache.get("/a", ("GET", 200)))
+        self.assertEqual(self.cache.stats()["bytes"], 60)
+
+    def test_too_large_entry_is_not_stored(self):
+        self.cache.put("/a", ("GET", 200), "a", 101)
+        self.assertIsNone(self.cache.get("/a", ("GET", 200)))
+
+    def test_lru_order(self):
+        for i in range(4):
+            self.cache.put(f"/{i}", ("GET", 200), i, 1)
+        self.cache.get("/0", ("GET", 200))
+        self.cache.put("/4", ("GET", 200), 4, 1)
+        self.assertEqual(self.cache.get("/0", ("GET", 200)), 0)
+        self.assertIsNone(self.cache.get("/1", ("GET", 200)))
+
+    def test_invalidate(self):
+        self.cache.put("/a", ("GET", 200), "a", 1)
+        self.cache.put("/a", ("GET", 404), "b", 1)
+        self.cache.invalidate("/a")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_ttl(self):
+        cache = ResponseCache(4, 100, ttl=0.01)
+        cache.put("/a", ("GET", 200), "a", 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("/a", ("GET", 200)))
+
+
+if __name__ == "__main__":
+    unittest.main()
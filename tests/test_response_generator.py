@@ -0,0 +1,299 @@
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from models.request import Request
+from utils.file_manager import FileManager
+from utils.response_cache import ResponseCache
+from utils.response_generator import ResponseGenerator
+
+
+class TestResponseGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        root_folder = os.path.join(self.folder, "root")
+        media_folder = os.path.join(self.folder, "media")
+        home_page_file = os.path.join(root_folder, "index.html")
+        os.makedirs(root_folder)
+        with open(home_page_file, "w") as f:
+            f.write("<html></html>")
+        with open(os.path.join(root_folder, "long.html"), "w") as f:
+            f.write("<p>text</p>" * 200)
+        os.makedirs(media_folder)
+        with open(os.path.join(media_folder, "image.jpg"), "wb") as f:
+            f.write(bytes(range(100)))
+        self.file_manager = FileManager(root_folder, home_page_file, media_folder)
+        self.cache = ResponseCache(16, 1 << 16)
+        self.generator = ResponseGenerator(
+            self.file_manager, 50, True, self.cache, 2, 1 << 16, 1024
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def make_request(self, url="/index", method="GET", **headers):
+        request = Request(method, url, "HTTP/1.1", url.rsplit("/", 1)[-1])
+        request.connection = "keep-alive"
+        request.requests_count = 1
+        for name, value in headers.items():
+            setattr(request, name, value)
+        return request
+
+    def read_body(self, response):
+        return response.body + b"".join(response.chunks or ())
+
+    def upload(self, filename, data):
+        file = self.file_manager.open_media_upload()
+        file.write(data)
+        self.file_manager.commit_media_upload(
+            file, filename, hashlib.sha256(data).hexdigest()
+        )
+
+    def test_generate_response(self):
+        response, code = self.generator.generate_response(self.make_request())
+        self.assertEqual(code, 200)
+        self.assertEqual(response.body, b"<html></html>")
+        self.assertIn(b"Content-Length: 13\r\n", response.head)
+        self.assertTrue(response.connection.endswith(b"max=49\r\n\r\n"))
+
+    def test_file_edited_in_place(self):
+        self.generator.generate_response(self.make_request("/image.jpg"))
+        with open(os.path.join(self.folder, "media", "image.jpg"), "wb") as f:
+            f.write(b"edited")
+        self.cache.clear()
+
+        response, _ = self.generator.generate_response(self.make_request("/image.jpg"))
+        self.assertEqual(response.body, b"edited")
+        self.assertIn(b"Content-Length: 6\r\n", response.head)
+
+        self.generator._sendfile_min_size = 0
+        response, _ = self.generator.generate_response(self.make_request("/image.jpg"))
+        self.assertEqual(response.parts[0].count, 6)
+        self.assertIn(b"Content-Length: 6\r\n", response.head)
+
+    def test_cache_and_compression_with_defaults(self):
+        generator = ResponseGenerator(self.file_manager, 50, True, self.cache, 2)
+        for _ in range(3):
+            generator.generate_response(self.make_request())
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 1, 1))
+        generator = ResponseGenerator(
+            self.file_manager, 50, True, self.cache, 2, compression_min_size=1024
+        )
+        response, _ = generator.generate_response(
+            self.make_request("/long", encoding="gzip")
+        )
+        self.assertIn(b"Content-Encoding: gzip\r\n", response.head)
+
+    def test_not_found(self):
+        response, code = self.generator.generate_response(
+            self.make_request("/missing")
+        )
+        self.assertEqual(code, 404)
+        self.assertTrue(response.head.startswith(b"HTTP/1.1 404 Not found\r\n"))
+
+    def test_too_many_requests(self):
+        response, code = self.generator.generate_response(
+            self.make_request(too_many_requests=3)
+        )
+        self.assertEqual(code, 429)
+        self.assertIn(b"Retry-After: 3\r\n", response.head)
+
+    def test_if_none_match(self):
+        etag = self.file_manager.get_route("/index").etag
+        response, code = self.generator.generate_response(
+            self.make_request(if_none_match=f'"other", {etag}')
+        )
+        self.assertEqual(code, 304)
+        self.assertEqual(response.body, b"")
+        self.assertIn(f"ETag: {etag}\r\n".encode(), response.head)
+
+        _, code = self.generator.generate_response(
+            self.make_request(if_none_match='"other"')
+        )
+        self.assertEqual(code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.file_manager.get_route("/index").last_modified
+        _, code = self.generator.generate_response(
+            self.make_request(if_modified_since=last_modified)
+        )
+        self.assertEqual(code, 304)
+        _, code = self.generator.generate_response(
+            self.make_request(if_modified_since="Thu, 01 Jan 1970 00:00:00 GMT")
+        )
+        self.assertEqual(code, 200)
+
+    def test_compressed_variant(self):
+        response, code = self.generator.generate_response(
+            self.make_request("/long", encoding="gzip")
+        )
+        self.assertEqual(code, 200)
+        self.assertEqual(gzip.decompress(response.body), b"<p>text</p>" * 200)
+        self.assertIn(b"Content-Encoding: gzip\r\n", response.head)
+        self.assertIn(b"Vary: Accept-Encoding\r\n", response.head)
+
+        identity, _ = self.generator.generate_response(self.make_request("/long"))
+        self.assertEqual(identity.body, b"<p>text</p>" * 200)
+        self.assertIn(b"Vary: Accept-Encoding\r\n", identity.head)
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+    def test_small_files_are_not_compressed(self):
+        response, _ = self.generator.generate_response(
+            self.make_request(encoding="gzip")
+        )
+        self.assertEqual(response.body, b"<html></html>")
+
+    def test_single_range(self):
+        response, code = self.generator.generate_response(
+            self.make_request("/image.jpg", range="bytes=10-19")
+        )
+        self.assertEqual(code, 206)
+        self.assertIn(b"Content-Range: bytes 10-19/100\r\n", response.head)
+        self.assertIn(b"Content-Length: 10\r\n", response.head)
+        self.assertEqual(response.parts[0].offset, 10)
+        self.assertEqual(response.parts[0].count, 10)
+
+    def test_multiple_ranges(self):
+        response, code = self.generator.generate_response(
+            self.make_request("/image.jpg", range="bytes=0-9,-10")
+        )
+        self.assertEqual(code, 206)
+        self.assertIn(b"multipart/byteranges; boundary=", response.head)
+        length = sum(
+            len(part) if isinstance(part, bytes) else part.count
+            for part in response.parts
+        )
+        self.assertIn(f"Content-Length: {length}\r\n".encode(), response.head)
+
+    def test_unsatisfiable_range(self):
+        response, code = self.generator.generate_response(
+            self.make_request("/image.jpg", range="bytes=100-")
+        )
+        self.assertEqual(code, 416)
+        self.assertIn(b"Content-Range: bytes */100\r\n", response.head)
+
+    def test_if_range_mismatch(self):
+        _, code = self.generator.generate_response(
+            self.make_request("/image.jpg", range="bytes=0-9", if_range='"old"')
+        )
+        self.assertEqual(code, 200)
+
+    def test_download_pages(self):
+        root_folder = os.path.join(self.folder, "root")
+        with open(os.path.join(root_folder, "download.html"), "w") as f:
+            f.write("<ul>{{ links|raw }}</ul>")
+        for name in ["a.jpg", "b.jpg", "c.jpg"]:
+            with open(os.path.join(self.folder, "media", name), "wb") as f:
+                f.write(b"data")
+        self.file_manager.index_files()
+        generator = ResponseGenerator(
+            self.file_manager, 50, True, None, 2, download_page_size=2
+        )
+
+        response, _ = generator.generate_response(self.make_request("/download"))
+        body = self.read_body(response)
+        self.assertIn(b'<a href="/a.jpg">a.jpg</a>', body)
+        self.assertIn(b'<a href="/b.jpg">b.jpg</a>', body)
+        self.assertNotIn(b"c.jpg", body)
+        self.assertIn(b"page=2", body)
+
+        request = self.make_request("/download", query={"page": "2"})
+        response, _ = generator.generate_response(request)
+        body = self.read_body(response)
+        self.assertIn(b'<a href="/image.jpg">image.jpg</a>', body)
+        self.assertIn(b"Previous", body)
+
+        request = self.make_request("/download", query={"prefix": "c"})
+        response, _ = generator.generate_response(request)
+        body = self.read_body(response)
+        self.assertIn(b"c.jpg", body)
+        self.assertNotIn(b"a.jpg", body)
+
+    def test_download_listing_is_invalidated_on_upload(self):
+        root_folder = os.path.join(self.folder, "root")
+        with open(os.path.join(root_folder, "download.html"), "w") as f:
+            f.write("<ul>{{ links|raw }}</ul>")
+        self.file_manager.index_files()
+        response, _ = self.generator.generate_response(self.make_request("/download"))
+        body = self.read_body(response)
+        self.assertNotIn(b"new.jpg", body)
+        self.upload("new.jpg", b"data")
+        response, _ = self.generator.generate_response(self.make_request("/download"))
+        body = self.read_body(response)
+        self.assertIn(b"new.jpg", body)
+
+    def test_download_links_to_stored_objects(self):
+        root_folder = os.path.join(self.folder, "root")
+        with open(os.path.join(root_folder, "download.html"), "w") as f:
+            f.write("<ul>{{ links|raw }}</ul>")
+        self.file_manager.content_addressed = True
+        self.file_manager.index_files()
+        self.upload("new.jpg", b"data")
+        digest = "3a6eb0790f39ac87c94f3856b2dd2c5d110e6811602261a9a923d3bb23adc8b7"
+
+        response, _ = self.generator.generate_response(self.make_request("/download"))
+        body = self.read_body(response)
+        self.assertIn(f'<a href="/objects/{digest}.jpg">new.jpg</a>'.encode(), body)
+        self.assertNotIn(f">{digest}.jpg<".encode(), body)
+        response, code = self.generator.generate_response(
+            self.make_request(f"/objects/{digest}.jpg")
+        )
+        self.assertEqual(code, 200)
+        self.assertIn(b"immutable", response.head)
+
+    def test_download_is_chunked(self):
+        root_folder = os.path.join(self.folder, "root")
+        with open(os.path.join(root_folder, "download.html"), "w") as f:
+            f.write("<style>a { color: red }</style><ul>{{ links|raw }}</ul>")
+        self.file_manager.index_files()
+        response, _ = self.generator.generate_response(self.make_request("/download"))
+        body = self.read_body(response)
+        self.assertIn(b"Transfer-Encoding: chunked\r\n", response.head)
+        self.assertNotIn(b"Content-Length", response.head)
+        self.assertEqual(
+            body,
+            b'<style>a { color: red }</style><ul><a href="/image.jpg">image.jpg</a>\n'
+            b"</ul>",
+        )
+
+        request = self.make_request("/download", http_version="HTTP/1.0")
+        response, _ = self.generator.generate_response(request)
+        self.assertIsNone(response.chunks)
+        self.assertIn(b"Content-Length: 75\r\n", response.head)
+
+    def test_login_is_escaped(self):
+        root_folder = os.path.join(self.folder, "root")
+        with open(os.path.join(root_folder, "logger_name.html"), "w") as f:
+            f.write("<h1>{{ login }}</h1>")
+        self.file_manager.index_files()
+        request = self.make_request("/logger_name", "POST", page_name="logger_name")
+        request.login_body = "<script> x"
+        response, _ = self.generator.generate_response(request)
+        self.assertEqual(response.body, b"<h1>&lt;script&gt; x</h1>")
+        response, _ = self.generator.generate_response(
+            self.make_request("/logger_name")
+        )
+        self.assertEqual(response.body, b"<h1></h1>")
+
+    def test_stream_handler(self):
+        root_folder = os.path.join(self.folder, "root")
+        with open(os.path.join(root_folder, "logger_name.html"), "w") as f:
+            f.write("{{ login }}")
+        self.file_manager.index_files()
+        self.generator.add_stream_handler(
+            "/logger_name", lambda request: (piece for piece in [b"a", b"b"])
+        )
+        response, _ = self.generator.generate_response(
+            self.make_request("/logger_name", encoding="gzip")
+        )
+        self.assertIn(b"Content-Encoding: gzip\r\n", response.head)
+        self.assertIn(b"Transfer-Encoding: chunked\r\n", response.head)
+        self.assertEqual(gzip.decompress(self.read_body(response)), b"ab")
+
+if __name__ == "__main__":
+    unittest.main()
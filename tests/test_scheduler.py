@@ -0,0 +1,72 @@
+import unittest
+from threading import Event
+
+from utils.scheduler import ByteBudget, Lane
+
+
+class TestLane(unittest.TestCase):
+
+    def test_items_served_by_workers(self):
+        served = []
+        done = Event()
+
+        def handler(item):
+            served.append(item)
+            if len(served) == 3:
+                done.set()
+
+        lane = Lane("test", 2, 10, handler)
+        lane.start()
+        for item in range(3):
+            self.assertTrue(lane.submit(item))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(sorted(served), [0, 1, 2])
+
+    def test_worker_survives_handler_errors(self):
+        served = []
+        done = Event()
+
+        def handler(item):
+            if item == "fail":
+                raise ValueError(item)
+            served.append(item)
+            done.set()
+
+        lane = Lane("test", 1, 10, handler)
+        with self.assertLogs(level="ERROR"):
+            lane.start()
+            lane.submit("fail")
+            lane.submit("ok")
+            self.assertTrue(done.wait(5))
+        self.assertEqual(served, ["ok"])
+
+    def test_full_lane_rejects(self):
+        lane = Lane("test", 0, 2, lambda item: None)
+        self.assertTrue(lane.submit(1))
+        self.assertTrue(lane.submit(2))
+        self.assertFalse(lane.submit(3))
+        self.assertEqual(lane.pending, 2)
+        self.assertFalse(lane.idle)
+
+
+class TestByteBudget(unittest.TestCase):
+
+    def test_limit(self):
+        budget = ByteBudget(100)
+        self.assertTrue(budget.acquire(60))
+        self.assertFalse(budget.acquire(50))
+        self.assertTrue(budget.acquire(40))
+        budget.release(60)
+        self.assertTrue(budget.acquire(50))
+        self.assertEqual(budget.in_flight, 90)
+
+    def test_large_request_admitted_alone(self):
+        budget = ByteBudget(100)
+        self.assertTrue(budget.acquire(500))
+        self.assertFalse(budget.acquire(1))
+        budget.release(500)
+        self.assertEqual(budget.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
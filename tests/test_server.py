@@ -0,0 +1,283 @@
+import asyncio
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from threading import Thread
+from unittest.mock import patch
+
+from main import Server, create_server_socket
+
+UPLOAD_BODY = (
+    b"--XYZ\r\n"
+    b'Content-Disposition: form-data; name="file"; filename="up.jpg"\r\n'
+    b"Content-Type: image/jpeg\r\n\r\n"
+    b"\xff\xd8image\r\n--XYZ--\r\n"
+)
+
+
+def make_config(folder, **overrides):
+    """Server configuration over a temporary root and media folder"""
+    root = os.path.join(folder, "root")
+    os.makedirs(root)
+    with open(os.path.join(root, "index.html"), "w") as f:
+        f.write("<html>index</html>")
+    with open(os.path.join(root, "logger_name.html"), "w") as f:
+        f.write("<p>{{ login }}</p>")
+    with open(os.path.join(root, "uploaded_image.html"), "w") as f:
+        f.write("<p>uploaded</p>")
+    config = {
+        "port": "0",
+        "ip-address": "127.0.0.1",
+        "root": root,
+        "media": os.path.join(folder, "media"),
+        "home-page-path": os.path.join(root, "index.html"),
+        "access-log": os.path.join(folder, "access.log"),
+        "error-log": os.path.join(folder, "error.log"),
+        "request-size": "2048",
+        "connections-limit": "4",
+        "client-connections-limit": "50",
+        "too-many-requests-limit": "1000",
+        "too-many-requests-span": "2",
+        "keep-alive": "True",
+        "keep-alive-timeout": "2",
+        "keep-alive-max-requests": "50",
+        "debug": "",
+        "browser-caching": "True",
+        "server-cash-size": "16",
+    }
+    config.update(overrides)
+    return config
+
+
+def upload_request():
+    return (
+        b"POST /uploaded_image HTTP/1.1\r\n"
+        b"Content-Type: multipart/form-data; boundary=XYZ\r\n"
+        b"Content-Length: %d\r\n\r\n" % len(UPLOAD_BODY)
+    ) + UPLOAD_BODY
+
+
+class AsyncServerTestCase(unittest.IsolatedAsyncioTestCase):
+    config = {}
+
+    async def asyncSetUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.server = Server(make_config(self.folder, **self.config))
+        self.server_socket = create_server_socket("127.0.0.1", 0, 16)
+        self.port = self.server_socket.getsockname()[1]
+        self.task = asyncio.create_task(self.server.run_async(self.server_socket))
+        self.writers = []
+
+    async def asyncTearDown(self):
+        for writer in self.writers:
+            writer.close()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.server_socket.close()
+        shutil.rmtree(self.folder)
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writers.append(writer)
+        return reader, writer
+
+    async def read_response(self, reader):
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        lines = head.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return int(lines[0].split(" ")[1]), headers, body
+
+    async def request(self, data):
+        reader, writer = await self.connect()
+        writer.write(data)
+        return await self.read_response(reader)
+
+
+class TestAsyncServer(AsyncServerTestCase):
+    async def test_routing(self):
+        code, _, body = await self.request(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertEqual(code, 200)
+        self.assertEqual(body, b"<html>index</html>")
+        code, _, _ = await self.request(b"GET /missing HTTP/1.1\r\n\r\n")
+        self.assertEqual(code, 404)
+
+    async def test_keep_alive(self):
+        reader, writer = await self.connect()
+        for remaining in (49, 48):
+            writer.write(b"GET / HTTP/1.1\r\nConnection: keep-alive\r\n\r\n")
+            code, headers, _ = await self.read_response(reader)
+            self.assertEqual(code, 200)
+            self.assertEqual(headers["keep-alive"], f"timeout=2, max={remaining}")
+
+    async def test_malformed_request(self):
+        code, _, _ = await self.request(b"GARBAGE\r\n\r\n")
+        self.assertEqual(code, 400)
+
+    async def test_malformed_login(self):
+        code, _, _ = await self.request(
+            b"POST /logger_name HTTP/1.1\r\nContent-Length: 4\r\n\r\nname"
+        )
+        self.assertEqual(code, 400)
+
+    async def test_upload(self):
+        code, _, _ = await self.request(upload_request())
+        self.assertEqual(code, 200)
+        with open(os.path.join(self.folder, "media", "up.jpg"), "rb") as f:
+            self.assertEqual(f.read(), b"\xff\xd8image")
+        code, _, body = await self.request(b"GET /up.jpg HTTP/1.1\r\n\r\n")
+        self.assertEqual((code, body), (200, b"\xff\xd8image"))
+
+    async def test_rate_limited_bodies_are_not_read(self):
+        login = b"POST /logger_name HTTP/1.1\r\nContent-Length: 4\r\n\r\nname"
+        with patch.object(self.server._rate_limiter, "check", return_value=3):
+            for data in (upload_request(), login):
+                code, headers, _ = await self.request(data)
+                self.assertEqual(code, 429)
+                self.assertEqual(headers["retry-after"], "3")
+        self.assertFalse(os.listdir(os.path.join(self.folder, "media")))
+
+
+class TestAsyncServerLimits(AsyncServerTestCase):
+    config = {"client-connections-limit": "1", "too-many-requests-limit": "2"}
+
+    async def test_client_connections_limit(self):
+        reader, writer = await self.connect()
+        writer.write(b"GET / HTTP/1.1\r\nConnection: keep-alive\r\n\r\n")
+        await self.read_response(reader)
+        code, headers, _ = await self.request(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertEqual(code, 429)
+        self.assertEqual(headers["retry-after"], "2")
+
+    async def test_too_many_requests(self):
+        reader, writer = await self.connect()
+        codes = []
+        for _ in range(3):
+            writer.write(b"GET / HTTP/1.1\r\nConnection: keep-alive\r\n\r\n")
+            codes.append((await self.read_response(reader))[0])
+        self.assertEqual(codes, [200, 200, 429])
+
+
+class TestThreadedServer(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.server = Server(
+            make_config(
+                self.folder,
+                **{
+                    "connections-limit": "1",
+                    "metrics-url": "/metrics",
+                    "upload-max-inflight-bytes": "1000",
+                },
+            )
+        )
+        self.server_socket = create_server_socket("127.0.0.1", 0, 16)
+        self.address = self.server_socket.getsockname()
+        self.thread = Thread(
+            target=self.server.run, args=(self.server_socket,), daemon=True
+        )
+        self.thread.start()
+        while self.server._connection_manager is None:
+            time.sleep(0.01)
+        self.clients = []
+
+    def tearDown(self):
+        self.server._connection_manager.stop()
+        self.thread.join(5)
+        self.server_socket.close()
+        for client in self.clients:
+            client.close()
+        shutil.rmtree(self.folder)
+
+    def request(self, data):
+        client = socket.create_connection(self.address, 5)
+        self.clients.append(client)
+        client.sendall(data)
+        response = b""
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                return response
+            response += chunk
+
+    def prepare(self, head):
+        return self.server._prepare_request(head, ("127.0.0.1", 1), 1)
+
+    def test_lane_selection(self):
+        lanes = {
+            b"GET / HTTP/1.1": None,
+            b"GET /logger_name HTTP/1.1": self.server._dynamic_lane,
+            b"GET /metrics HTTP/1.1": self.server._dynamic_lane,
+            b"POST /logger_name HTTP/1.1": self.server._dynamic_lane,
+            b"POST /uploaded_image HTTP/1.1": self.server._upload_lane,
+        }
+        for head, lane in lanes.items():
+            self.assertIs(self.server._select_lane(self.prepare(head)), lane)
+
+    def test_requests_served_in_lanes(self):
+        response = self.request(b"GET /metrics HTTP/1.1\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK\r\n"))
+        response = self.request(upload_request())
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, "media", "up.jpg")))
+        self.assertEqual(self.server._upload_budget.in_flight, 0)
+
+    def test_malformed_login(self):
+        response = self.request(
+            b"POST /logger_name HTTP/1.1\r\nContent-Length: 9\r\n\r\nname=John"
+        )
+        self.assertTrue(response.startswith(b"HTTP/1.1 400 "))
+
+    def test_upload_over_budget_is_rejected(self):
+        self.assertTrue(self.server._upload_budget.acquire(1000))
+        response = self.request(
+            b"POST /uploaded_image HTTP/1.1\r\n"
+            b"Content-Type: multipart/form-data; boundary=XYZ\r\n"
+            b"Content-Length: 100000\r\n\r\n"
+        )
+        self.assertTrue(response.startswith(b"HTTP/1.1 503 "))
+        self.assertIn(b"Retry-After: 1\r\n", response)
+        self.assertEqual(self.server._upload_budget.in_flight, 1000)
+        started = time.monotonic()
+        response = self.request(b"GET / HTTP/1.1\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_rate_limited_upload_is_not_saved(self):
+        with patch.object(self.server._rate_limiter, "check", side_effect=[0, 3, 3]):
+            responses = [self.request(upload_request()) for _ in range(3)]
+        self.assertTrue(responses[0].startswith(b"HTTP/1.1 200 OK\r\n"))
+        for response in responses[1:]:
+            self.assertTrue(response.startswith(b"HTTP/1.1 429 "))
+            self.assertIn(b"Retry-After: 3\r\n", response)
+        self.assertEqual(os.listdir(os.path.join(self.folder, "media")), ["up.jpg"])
+
+    def test_full_lane_is_rejected(self):
+        with patch.object(self.server._upload_lane, "submit", return_value=False):
+            response = self.request(upload_request())
+        self.assertTrue(response.startswith(b"HTTP/1.1 503 "))
+        self.assertEqual(self.server._upload_budget.in_flight, 0)
+        self.assertFalse(os.listdir(os.path.join(self.folder, "media")))
+
+
+class TestServerSocket(unittest.TestCase):
+
+    def test_port_is_exclusive_without_reuse_port(self):
+        first = create_server_socket("127.0.0.1", 0, 1)
+        self.addCleanup(first.close)
+        with self.assertRaises(OSError):
+            create_server_socket("127.0.0.1", first.getsockname()[1], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
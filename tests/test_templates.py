@@ -0,0 +1,41 @@
+import unittest
+
+from models.exceptions import TemplateException
+from utils.templates import Template
+
+
+class TestTemplates(unittest.TestCase):
+
+    def test_static_segments_are_encoded_once(self):
+        template = Template("<style>p { color: red }</style><p>{{ name }}</p>")
+        self.assertEqual(
+            template.segments[0], b"<style>p { color: red }</style><p>"
+        )
+        self.assertEqual(template.segments[1].name, "name")
+        self.assertEqual(template.segments[2], b"</p>")
+
+    def test_render_escapes_text(self):
+        template = Template("<p>{{name}}</p>")
+        self.assertEqual(
+            template.render(name='<b>"A" & B</b>'),
+            b"<p>&lt;b&gt;&quot;A&quot; &amp; B&lt;/b&gt;</p>",
+        )
+
+    def test_render_raw(self):
+        template = Template("<ul>{{ links | raw }}</ul>")
+        self.assertEqual(template.render(links="<li>a</li>"), b"<ul><li>a</li></ul>")
+
+    def test_missing_value(self):
+        self.assertEqual(Template("<p>{{ name }}</p>").render(), b"<p></p>")
+
+    def test_render_chunks(self):
+        template = Template("a{{ x }}b")
+        self.assertEqual(list(template.render_chunks(x=1)), [b"a", b"1", b"b"])
+
+    def test_unknown_slot_kind(self):
+        with self.assertRaises(TemplateException):
+            Template("{{ name|bold }}", "page.html")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import signal
+import time
+import unittest
+
+from utils.worker_supervisor import WorkerSupervisor
+
+
+def sleep_forever(index):
+    while True:
+        time.sleep(1)
+
+
+class TestWorkerSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = WorkerSupervisor(2, sleep_forever, restart_delay=0)
+
+    def tearDown(self):
+        self.supervisor.stop()
+
+    def test_start(self):
+        self.supervisor.start()
+        self.assertEqual(len(self.supervisor.pids), 2)
+
+    def test_restart_crashed_worker(self):
+        self.supervisor.start()
+        crashed = self.supervisor.pids[0]
+        os.kill(crashed, signal.SIGKILL)
+        self.supervisor.wait_worker()
+        self.assertEqual(len(self.supervisor.pids), 2)
+        self.assertNotIn(crashed, self.supervisor.pids)
+
+    def test_stop(self):
+        self.supervisor.start()
+        pids = self.supervisor.pids
+        self.supervisor.stop()
+        self.assertEqual(self.supervisor.pids, [])
+        for pid in pids:
+            with self.assertRaises(ChildProcessError):
+                os.waitpid(pid, os.WNOHANG)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import queue
+import time
+from threading import Event, Lock, Thread
+
+LOG_FORMATS = ("common", "common-us", "json")
+
+
+class AccessLog:
+    """Writes access records from a bounded queue in a background thread.
+    Request threads never wait for the disk: when the queue is full the
+    record is dropped and counted.
+
+    Worker processes share one file, so only the log created with
+    rotate=True renames it. The others reopen the path once they see it
+    was moved, and until then append to the rotated file."""
+
+    def __init__(
+        self,
+        path,
+        mode="w",
+        log_format="common",
+        queue_size=10000,
+        batch_size=256,
+        flush_interval=1.0,
+        max_bytes=0,
+        rotate_interval=0,
+        backup_count=5,
+        rotate=True,
+    ):
+        if log_format not in LOG_FORMATS:
+            raise ValueError(log_format)
+        self.path = path
+        self._format = log_format
+        self._queue = queue.Queue(queue_size)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_bytes = max_bytes
+        self._rotate_interval = rotate_interval
+        self._backup_count = backup_count
+        self._rotate_enabled = rotate
+        self._file = open(path, mode, encoding="utf-8")
+        self._opened = time.time()
+        self._drop_lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+        self._timestamp = (None, "")
+        self.dropped = 0
+
+    def log(self, request_info, code, length, duration):
+        """Queues a record without blocking and returns False if it was
+        dropped"""
+        record = (
+            time.time(),
+            request_info.client,
+            request_info.method,
+            request_info.url,
+            request_info.http_version,
+            code,
+            length,
+            request_info.user_agent,
+            duration,
+        )
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self._file.close()
+
+    def flush(self):
+        """Writes every queued record"""
+        while self._write_batch():
+            pass
+        self._file.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                record = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                continue
+            try:
+                self._write_batch([record])
+                self._file.flush()
+                self._rotate_if_needed()
+            except OSError:
+                logging.error("Access log exception", exc_info=True)
+                self._stopped.wait(self._flush_interval)
+
+    def _write_batch(self, batch=None):
+        batch = batch or []
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._file.write("".join(self._format_record(r) for r in batch))
+        return len(batch)
+
+    def _format_record(self, record):
+        (
+            timestamp,
+            client,
+            method,
+            url,
+            http_version,
+            code,
+            length,
+            user_agent,
+            duration,
+        ) = record
+        duration_us = int(duration * 1e6)
+        if self._format == "json":
+            return (
+                json.dumps(
+                    {
+                        "time": timestamp,
+                        "client": client,
+                        "method": method,
+                        "url": url,
+                        "http_version": http_version,
+                        "status": code,
+                        "length": length,
+                        "user_agent": user_agent,
+                        "duration_us": duration_us,
+                    }
+                )
+                + "\n"
+            )
+        line = (
+            f'{client} - - [{self._format_time(timestamp)}] '
+            f'"{method} {url} {http_version}" {code} {length or "-"}'
+        )
+        if self._format == "common-us":
+            line += f" {duration_us}"
+        return line + "\n"
+
+    def _format_time(self, timestamp):
+        """Formats the time once per second"""
+        second = int(timestamp)
+        if self._timestamp[0] != second:
+            formatted = time.strftime("%d/%b/%Y:%H:%M:%S %z", time.localtime(second))
+            self._timestamp = (second, formatted)
+        return self._timestamp[1]
+
+    def _rotate_if_needed(self):
+        if not self._rotate_enabled:
+            self._reopen_if_moved()
+        elif self._max_bytes and self._get_size() >= self._max_bytes:
+            self._rotate()
+        elif (
+            self._rotate_interval
+            and time.time() - self._opened >= self._rotate_interval
+        ):
+            self._rotate()
+
+    def _get_size(self):
+        """Size of the file with the records of every process"""
+        return os.fstat(self._file.fileno()).st_size
+
+    def _reopen_if_moved(self):
+        try:
+            moved = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self._reopen()
+
+    def _rotate(self):
+        """Renames access.log to access.log.1, shifting older files up to
+        backup_count, and starts a new file"""
+        for i in range(self._backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self._backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._reopen()
+
+    def _reopen(self):
+        file = open(self.path, "a", encoding="utf-8")
+        self._file.close()
+        self._file = file
+        self._opened = time.time()
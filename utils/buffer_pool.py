@@ -0,0 +1,42 @@
+from threading import Lock
+
+from models.exceptions import BufferPoolExhaustedException
+
+
+class BufferPool:
+    """Free list of equally sized receive buffers shared by connections.
+    At most memory_limit bytes of buffers are kept; a buffer released
+    when the pool is full is left to the garbage collector. Buffers
+    handed out at once are capped by in_use_limit bytes, 0 means no cap,
+    and acquire raises BufferPoolExhaustedException past it."""
+
+    def __init__(self, buffer_size, memory_limit, in_use_limit=0):
+        self.buffer_size = buffer_size
+        self._capacity = max(0, memory_limit // buffer_size)
+        self._in_use_limit = in_use_limit
+        self._max_in_use = max(1, in_use_limit // buffer_size)
+        self._free = []
+        self._lock = Lock()
+        self.created = 0
+        self.in_use = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._in_use_limit and self.in_use >= self._max_in_use:
+                raise BufferPoolExhaustedException(self._in_use_limit)
+            self.in_use += 1
+            if self._free:
+                return self._free.pop()
+            self.created += 1
+        return bytearray(self.buffer_size)
+
+    def release(self, buffer):
+        if len(buffer) != self.buffer_size:
+            return
+        with self._lock:
+            self.in_use -= 1
+            if len(self._free) < self._capacity:
+                self._free.append(buffer)
+
+    def __len__(self):
+        return len(self._free)
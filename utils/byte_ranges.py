@@ -0,0 +1,37 @@
+MAX_RANGES = 16
+
+
+def parse_range(header, size):
+    """Parses a Range header into a list of inclusive (start, end) pairs.
+    Returns None when the header is invalid or should be ignored and an
+    empty list when no range can be satisfied."""
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges:
+        return None
+    specs = ranges.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+    result = []
+    for spec in specs:
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if not first:
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(0, size - suffix), size - 1
+            else:
+                start = int(first)
+                end = size - 1
+                if last:
+                    end = int(last)
+                    if end < start:
+                        return None
+                    end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size:
+            result.append((start, end))
+    return result
@@ -0,0 +1,64 @@
+import gzip
+import zlib
+
+SUPPORTED_ENCODINGS = ("gzip", "deflate")
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+}
+
+
+def is_compressible(content_type):
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+
+
+def negotiate_encoding(accept_encoding):
+    """Picks the supported coding with the highest q-value from an
+    Accept-Encoding header, preferring gzip on ties"""
+    best, best_q = None, 0.0
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter.strip() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        if name == "*":
+            name = SUPPORTED_ENCODINGS[0] if best is None else best
+        if name not in SUPPORTED_ENCODINGS or q <= 0:
+            continue
+        if (
+            best is None
+            or q > best_q
+            or q == best_q
+            and SUPPORTED_ENCODINGS.index(name) < SUPPORTED_ENCODINGS.index(best)
+        ):
+            best, best_q = name, q
+    return best
+
+
+def compress(data, encoding, level=6):
+    if encoding == "gzip":
+        return gzip.compress(data, level, mtime=0)
+    if encoding == "deflate":
+        return zlib.compress(data, level)
+    raise ValueError(encoding)
+
+
+def compress_stream(chunks, encoding, level=6):
+    """Compresses an iterable of bytes piece by piece, yielding output as
+    soon as the compressor produces it"""
+    if encoding not in SUPPORTED_ENCODINGS:
+        raise ValueError(encoding)
+    wbits = 31 if encoding == "gzip" else 15
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,253 @@
+import heapq
+import itertools
+import select
+import selectors
+import socket
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from utils.metrics import IDLE_CONNECTIONS
+from utils.scheduler import Lane
+
+
+class Connection:
+    """Client socket and the state kept between its requests. A connection
+    with a rejection is answered with it and closed once readable. A
+    connection with head_deadline has part of a request head buffered and
+    is closed if the rest does not arrive by then."""
+
+    __slots__ = (
+        "sock",
+        "address",
+        "reader",
+        "keep_alive",
+        "requests_count",
+        "rejection",
+        "head_deadline",
+    )
+
+    def __init__(self, sock, address, reader=None, keep_alive=False, rejection=None):
+        self.sock = sock
+        self.address = address
+        self.reader = reader
+        self.keep_alive = keep_alive
+        self.requests_count = 0
+        self.rejection = rejection
+        self.head_deadline = None
+
+
+class ConnectionManager:
+    """Accepts clients and parks idle sockets in a selector, so a worker
+    thread is only taken when a request arrives. Readable connections wait
+    in a bounded queue; when it is full the client is answered with
+    busy_response and closed. Connections idle for longer than
+    idle_timeout are closed, and connections parked with part of a head
+    once their head_deadline passes. serve can keep a quick client with
+    wait_readable instead of parking it.
+
+    open_connection(sock, address) returns a Connection or None,
+    serve(connection) returns True to park the connection again, False to
+    close it with close_connection(connection), or None when it was handed
+    to another thread that parks, dispatches or closes it later."""
+
+    def __init__(
+        self,
+        server_socket,
+        open_connection,
+        serve,
+        close_connection,
+        workers_count,
+        queue_limit,
+        idle_timeout,
+        busy_response,
+        metrics=None,
+        linger=0,
+    ):
+        self._server_socket = server_socket
+        self._open_connection = open_connection
+        self._serve = serve
+        self._close_connection = close_connection
+        self._lane = Lane("connections", workers_count, queue_limit, self._work)
+        self._idle_timeout = idle_timeout
+        self._busy_response = busy_response
+        self._metrics = metrics
+        self._linger_ms = int(linger * 1000)
+        self._selector = selectors.DefaultSelector()
+        self._idle = OrderedDict()
+        self._heads = {}
+        self._head_deadlines = []
+        self._sequence = itertools.count()
+        self._parking = []
+        self._parking_lock = Lock()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._stopping = False
+        self.rejected = 0
+
+    @property
+    def parked(self):
+        return len(self._idle) + len(self._heads)
+
+    @property
+    def pending(self):
+        return self._lane.pending
+
+    def run(self):
+        """Runs the selector loop on the calling thread"""
+        self._lane.start()
+        self._server_socket.setblocking(False)
+        self._selector.register(self._server_socket, selectors.EVENT_READ)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        while not self._stopping:
+            for key, _ in self._selector.select(self._next_timeout()):
+                if key.fileobj is self._server_socket:
+                    self._accept()
+                elif key.fileobj is self._wakeup_reader:
+                    self._register_parked()
+                else:
+                    self._unpark(key.data)
+            self._expire()
+        for connection in [*self._idle, *self._heads]:
+            self._remove_idle(connection)
+            self._close_connection(connection)
+        self._selector.close()
+
+    def stop(self):
+        """Makes run return after closing the idle connections"""
+        self._stopping = True
+        self._wakeup()
+
+    def park(self, connection):
+        """Hands a connection back to the selector from a worker thread"""
+        with self._parking_lock:
+            self._parking.append(connection)
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except BlockingIOError:
+            pass
+
+    def dispatch(self, connection):
+        """Queues a connection that has a request to serve, or answers it
+        with busy_response when the queue is full"""
+        if not self._lane.submit(connection):
+            self.rejected += 1
+            self.reject(connection, self._busy_response)
+
+    def _work(self, connection):
+        served = self._serve(connection)
+        if served:
+            self.park(connection)
+        elif served is not None:
+            self._close_connection(connection)
+
+    def wait_readable(self, connection):
+        """Waits up to linger for the next request of a client that answers
+        quickly, which is cheaper than parking it. Workers do not wait
+        while other connections are queued."""
+        if not self._linger_ms or not self._lane.idle:
+            return False
+        poller = select.poll()
+        poller.register(connection.sock, select.POLLIN)
+        return bool(poller.poll(self._linger_ms))
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self._server_socket.accept()
+            except OSError:
+                return
+            connection = self._open_connection(sock, address)
+            if connection is not None:
+                self._add_idle(connection)
+
+    def _register_parked(self):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._parking_lock:
+            parking, self._parking = self._parking, []
+        for connection in parking:
+            self._add_idle(connection)
+
+    def _add_idle(self, connection):
+        try:
+            self._selector.register(connection.sock, selectors.EVENT_READ, connection)
+        except (ValueError, OSError):
+            self._close_connection(connection)
+            return
+        deadline = connection.head_deadline
+        if deadline is None:
+            self._idle[connection] = time.monotonic() + self._idle_timeout
+        else:
+            self._heads[connection] = deadline
+            heapq.heappush(
+                self._head_deadlines, (deadline, next(self._sequence), connection)
+            )
+        self._count_idle(1)
+
+    def _remove_idle(self, connection):
+        self._selector.unregister(connection.sock)
+        if self._heads.pop(connection, None) is None:
+            del self._idle[connection]
+        self._count_idle(-1)
+
+    def _unpark(self, connection):
+        self._remove_idle(connection)
+        if connection.rejection is not None:
+            self.reject(connection, connection.rejection)
+            return
+        self.dispatch(connection)
+
+    def reject(self, connection, response):
+        """Answers with a pre-encoded response without waiting and closes
+        the connection. Request bytes that already arrived are read first
+        to avoid resetting the connection before the response arrives."""
+        sock = connection.sock
+        try:
+            sock.setblocking(False)
+            try:
+                sock.recv(65536)
+            except BlockingIOError:
+                pass
+            sock.send(response)
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        self._close_connection(connection)
+
+    def _expire(self):
+        """Idle connections are kept in the order they were parked, all
+        with the same timeout, so expired ones are at the front. Partial
+        heads have their own deadlines in a heap, where entries of
+        connections that were unparked since are skipped."""
+        now = time.monotonic()
+        while self._idle:
+            connection, deadline = next(iter(self._idle.items()))
+            if deadline > now:
+                break
+            self._remove_idle(connection)
+            self._close_connection(connection)
+        while self._head_deadlines and self._head_deadlines[0][0] <= now:
+            deadline, _, connection = heapq.heappop(self._head_deadlines)
+            if self._heads.get(connection) == deadline:
+                self._remove_idle(connection)
+                self._close_connection(connection)
+
+    def _next_timeout(self):
+        deadlines = [deadline for deadline, _, _ in self._head_deadlines[:1]]
+        if self._idle:
+            deadlines.append(next(iter(self._idle.values())))
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _count_idle(self, value):
+        if self._metrics is not None:
+            self._metrics.inc(IDLE_CONNECTIONS, value)
@@ -0,0 +1,161 @@
+import time
+
+from models.exceptions import (
+    BadRequestException,
+    HeaderTooLargeException,
+    RequestTimeoutException,
+)
+
+
+class ConnectionReader:
+    """Buffered reader over a client socket. Bytes received past the end
+    of a request stay in the buffer for the next one, so pipelined and
+    fragmented requests are split on their real boundaries.
+
+    Data is received with recv_into into one fixed buffer, taken from
+    pool when given, and handed out as memoryview slices of it. A slice
+    is only valid until the next read. close returns an empty buffer to
+    the pool and the next read takes one again, so idle connections do
+    not hold memory."""
+
+    def __init__(self, sock, chunk_size, header_size_limit, pool=None):
+        self._sock = sock
+        self._header_size_limit = header_size_limit
+        self._pool = pool
+        self._buffer_size = max(chunk_size, header_size_limit + 4)
+        self._buffer = None
+        self._view = None
+        self._start = 0
+        self._end = 0
+        self.head_started = None
+        self._head_pending = False
+
+    @property
+    def buffered(self):
+        return self._end - self._start
+
+    def read_head(self, deadline=None, wait=True):
+        """Returns the request line and headers without the terminating
+        empty line, or None if the client closed the connection.
+        head_started is set to when the first byte of the head arrived.
+        RequestTimeoutException is raised when the head is not complete
+        by deadline, a time.monotonic() value. Without wait BlockingIOError
+        is raised when no more bytes have arrived yet; they are kept and
+        the next call goes on with the same head."""
+        if self._buffer is None:
+            self._acquire()
+        searched = self._start
+        if not self._head_pending:
+            self.head_started = time.perf_counter() if self.buffered else None
+        self._head_pending = False
+        while True:
+            if self._skip_empty_lines():
+                searched = self._start
+            end = self._buffer.find(
+                b"\r\n\r\n", max(self._start, searched - 3), self._end
+            )
+            length = (self._end if end == -1 else end) - self._start
+            if length > self._header_size_limit:
+                raise HeaderTooLargeException(self._header_size_limit)
+            if end != -1:
+                head = self._view[self._start : end]
+                self._consume(end + 4 - self._start)
+                return head
+            searched = self._end
+            if self._end == len(self._buffer):
+                searched -= self._compact()
+            try:
+                received = self._receive(deadline, wait)
+            except BlockingIOError:
+                self._head_pending = True
+                raise
+            if not received:
+                if self.buffered:
+                    raise BadRequestException(
+                        bytes(self._view[self._start : self._end])
+                    )
+                return None
+            if self.head_started is None:
+                self.head_started = time.perf_counter()
+            self._end += received
+
+    def read_body(self, length):
+        """Returns the whole body. The chunks of iter_body are views of the
+        same buffer, so each one is copied out before the next read."""
+        body = bytearray()
+        for chunk in self.iter_body(length):
+            body += chunk
+        return bytes(body)
+
+    def iter_body(self, length):
+        """Yields exactly length bytes of the body in chunks"""
+        remaining = length
+        if self.buffered and remaining > 0:
+            size = min(remaining, self.buffered)
+            chunk = self._view[self._start : self._start + size]
+            self._consume(size)
+            remaining -= size
+            yield chunk
+        while remaining > 0:
+            received = self._sock.recv_into(
+                self._view, min(len(self._view), remaining)
+            )
+            if not received:
+                raise BadRequestException("body is shorter than Content-Length")
+            remaining -= received
+            yield self._view[:received]
+
+    def close(self, discard=False):
+        """Returns the buffer to the pool unless unread bytes are left.
+        With discard they are dropped, for a connection that is closed."""
+        if self._buffer is None or (self.buffered and not discard):
+            return
+        self._start = self._end = 0
+        if self._pool is not None:
+            self._pool.release(self._buffer)
+        self._view = None
+        self._buffer = None
+
+    def _acquire(self):
+        if self._pool is None:
+            self._buffer = bytearray(self._buffer_size)
+        else:
+            self._buffer = self._pool.acquire()
+        self._view = memoryview(self._buffer)
+        self._start = self._end = 0
+
+    def _receive(self, deadline, wait=True):
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RequestTimeoutException()
+            self._sock.settimeout(remaining if wait else 0)
+        elif not wait:
+            self._sock.settimeout(0)
+        try:
+            return self._sock.recv_into(self._view[self._end :])
+        except TimeoutError:
+            raise RequestTimeoutException() from None
+
+    def _consume(self, size):
+        self._start += size
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def _compact(self):
+        """Moves the unread bytes to the front of the full buffer and
+        returns how far they moved"""
+        shift = self._start
+        if shift == 0:
+            raise HeaderTooLargeException(self._header_size_limit)
+        size = self.buffered
+        self._buffer[:size] = self._buffer[self._start : self._end]
+        self._start, self._end = 0, size
+        return shift
+
+    def _skip_empty_lines(self):
+        skipped = False
+        while self._buffer.startswith(b"\r\n", self._start, self._end):
+            self._consume(2)
+            skipped = True
+        return skipped
@@ -1,35 +1,90 @@
+import hashlib
+import mimetypes
 import os
+import re
+import stat
+import tempfile
 import time
 from pathlib import Path
+from threading import Lock, Timer
 
-from models.exceptions import WrongPathException
+from models.exceptions import TemplateException, WrongPathException
+from models.route import Route
+from utils.compression import is_compressible
+from utils.index_snapshot import IndexSnapshot
+from utils.media_catalogue import MediaCatalogue
+from utils.templates import Template
+
+UPLOAD_PREFIX = ".upload-"
+DYNAMIC_PAGES = {"/logger_name", "/download"}
+DIGEST_PATTERN = re.compile(r"[0-9a-f]{64}")
+OBJECTS_FOLDER = "objects"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _read_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
 
 
 class FileManager:
-    def __init__(self, root_folder, home_page_file_path, media):
+    def __init__(
+        self,
+        root_folder,
+        home_page_file_path,
+        media,
+        browser_caching=True,
+        snapshot_path=None,
+        content_addressed=False,
+        snapshot_save_delay=30.0,
+    ):
         self.URLS = dict()
+        self.routes = dict()
         self.root_path = root_folder
         self.root_path_lvl = len(Path(root_folder).parts)
         self.media_path = media
         self.media_path_lvl = len(Path(media).parts)
         self.home_page = Path(home_page_file_path)
+        self.browser_caching = browser_caching
+        self.content_addressed = content_addressed
+        self._write_lock = Lock()
+        self._upload_mode = 0o666 & ~_read_umask()
+        self.media_catalogue = MediaCatalogue()
+        self._snapshot = None
+        self._snapshot_lock = Lock()
+        self._snapshot_save_delay = snapshot_save_delay
+        self._snapshot_timer = None
+        self._snapshot_changed = False
+        if snapshot_path:
+            self._snapshot = IndexSnapshot(snapshot_path)
+            self._snapshot.load()
         self.index_files()
-            
 
     def index_files(self):
         self._check_paths_existence()
-        self.update_urls(self.root_path)
-        self.update_urls(self.media_path, save_suffix=True)
-        self.URLS[Path("/")] = self.home_page
+        added = self._scan_urls(self.root_path)
+        if self._snapshot is None:
+            added.update(self._scan_urls(self.media_path, save_suffix=True))
+        else:
+            added.update(self._scan_media_snapshot())
+        added["/"] = self._create_route("/", self.home_page)
+        self._update_index(added, replace=True)
+
+    def get_route(self, url):
+        route = self.routes.get(url)
+        if route is None:
+            route = self.routes.get(str(Path(url)))
+        return route
 
     def contains(self, url):
-        return Path(url) in self.URLS
+        return self.get_route(url) is not None
 
     def get_page_path(self, url):
-        file = Path(url)
-        if file in self.URLS.keys():
-            return self.URLS[file]
-        raise WrongPathException(file)
+        route = self.get_route(url)
+        if route is None:
+            raise WrongPathException(Path(url))
+        return route.path
 
     def get_page_code(self, url):
         page_path = self.get_page_path(url)
@@ -37,30 +92,218 @@ class FileManager:
         with open(page_path, method) as content:
             return content.read()
 
+    def get_page_size(self, url):
+        route = self.get_route(url)
+        if route is None:
+            raise WrongPathException(Path(url))
+        return route.size
+
     def update_urls(self, root, save_suffix=False):
+        self._update_index(self._scan_urls(root, save_suffix))
+
+    def _scan_urls(self, root, save_suffix=False):
         levels = len(Path(root).parts)
+        media = self.path_starts_with(root, self.media_path)
+        added = {}
         stack = [root]
         while len(stack) > 0:
             for file in Path(stack.pop()).iterdir():
                 if file.is_dir():
                     stack.append(file)
                     continue
-                url = list(file.parts[levels:])
-                if not save_suffix and file.stem != "favicon":
-                    url[-1] = file.stem
-                self.URLS[Path(os.path.join("/", *url))] = file
+                if file.name.startswith(UPLOAD_PREFIX):
+                    continue
+                url = self._get_url(file, levels, save_suffix)
+                added[url] = self._create_route(url, file, media=media)
+        return added
+
+    def _scan_media_snapshot(self):
+        """Indexes media from the snapshot, reading only directories that
+        changed since it was saved"""
+        added = {}
+        for path, size, mtime, inode in self._snapshot.scan(self.media_path):
+            file = Path(path)
+            if file.name.startswith(UPLOAD_PREFIX):
+                continue
+            url = self._get_url(file, self.media_path_lvl, True)
+            added[url] = self._create_route(url, file, size, True, mtime, inode)
+        if self._snapshot.rescanned:
+            try:
+                self._snapshot.save()
+            except OSError:
+                pass
+        return added
 
-    def index_media(self, file_path):
+    def save_snapshot(self):
+        """Writes the media snapshot if the media index changed since it was
+        last written. Only directories whose mtime changed are read again,
+        so the next start does not stat the whole tree after uploads."""
+        with self._write_lock:
+            if self._snapshot_timer is not None:
+                self._snapshot_timer.cancel()
+                self._snapshot_timer = None
+            changed, self._snapshot_changed = self._snapshot_changed, False
+        if not changed:
+            return
+        with self._snapshot_lock:
+            try:
+                self._snapshot.scan(self.media_path)
+                self._snapshot.save()
+            except OSError:
+                pass
+
+    def _schedule_snapshot_save(self):
+        """Saves are batched: the first media change starts a timer and
+        later ones are written with it. Called with the write lock held."""
+        self._snapshot_changed = True
+        if self._snapshot_timer is None:
+            self._snapshot_timer = Timer(self._snapshot_save_delay, self.save_snapshot)
+            self._snapshot_timer.daemon = True
+            self._snapshot_timer.start()
+
+    def index_media(self, file_path, size=None):
         if not self.path_starts_with(file_path, self.media_path):
             return
         file = Path(file_path)
-        url = list(file.parts[self.root_path_lvl :])
-        self.URLS[Path(os.path.join("/", *url))] = file
+        url = self._get_url(file, self.media_path_lvl, True)
+        self._update_index({url: self._create_route(url, file, size, media=True)})
+
+    def get_url(self, file_path):
+        file = Path(file_path)
+        if self.path_starts_with(file, self.media_path):
+            return self._get_url(file, self.media_path_lvl, True)
+        if self.path_starts_with(file, self.root_path):
+            return self._get_url(file, self.root_path_lvl, False)
+        return None
+
+    def update_files(self, paths):
+        """Indexes new or changed files and returns the urls that changed"""
+        added = {}
+        for path in paths:
+            file = Path(path)
+            url = self.get_url(file)
+            if url is None or file.name.startswith(UPLOAD_PREFIX):
+                continue
+            media = self.path_starts_with(file, self.media_path)
+            try:
+                added[url] = self._create_route(url, file, media=media)
+                if file == self.home_page:
+                    added["/"] = self._create_route("/", file)
+            except (OSError, UnicodeDecodeError, TemplateException):
+                continue
+        self._update_index(added)
+        return list(added)
+
+    def remove_files(self, paths):
+        """Removes files, or every file under a directory, from the index
+        and returns the urls that were removed"""
+        paths = {str(path) for path in paths}
+        prefixes = tuple(os.path.join(path, "") for path in paths)
+        removed = [
+            url
+            for url, route in self.routes.items()
+            if str(route.path) in paths or str(route.path).startswith(prefixes)
+        ]
+        self._update_index(removed=removed)
+        return removed
+
+    def _update_index(self, added=None, removed=(), replace=False):
+        """Readers use the current dicts without locking, so changes are
+        applied to copies that replace them"""
+        with self._write_lock:
+            routes = {} if replace else dict(self.routes)
+            urls = {} if replace else dict(self.URLS)
+            media_removed = []
+            media_added = []
+            for url in removed:
+                route = routes.pop(url, None)
+                urls.pop(Path(url), None)
+                if route is not None and route.media:
+                    media_removed.append(url)
+            media_changed = bool(media_removed)
+            for url, route in (added or {}).items():
+                routes[url] = route
+                urls[Path(url)] = route.path
+                media_changed = media_changed or route.media
+                if route.media and not route.immutable:
+                    media_added.append(url)
+            self.routes = routes
+            self.URLS = urls
+            if replace:
+                self.media_catalogue.reset(media_added)
+            else:
+                self.media_catalogue.update(media_added, media_removed)
+                if media_changed and self._snapshot is not None:
+                    self._schedule_snapshot_save()
+
+    def _get_url(self, file, levels, save_suffix):
+        url = list(file.parts[levels:])
+        if not save_suffix and file.stem != "favicon":
+            url[-1] = file.stem
+        return os.path.join("/", *url)
+
+    def _create_route(self, url, file, size=None, media=False, mtime=None, inode=0):
+        if mtime is None:
+            mtime = time.time()
+        if size is None:
+            stat = file.stat()
+            size, mtime, inode = stat.st_size, stat.st_mtime, stat.st_ino
+        content_type = "text/html"
+        if file.suffix != ".html":
+            content_type = (
+                mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+            )
+        dynamic = url in DYNAMIC_PAGES
+        immutable, canonical_url = False, None
+        if media and self.content_addressed:
+            immutable, canonical_url = self._get_media_object(file)
+        cache_control = "public, max-age=86400"
+        if dynamic or not self.browser_caching:
+            cache_control = "no-store"
+        elif immutable:
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        template = None
+        if dynamic:
+            template = Template(file.read_text(encoding="utf-8"), file)
+        return Route(
+            url,
+            file,
+            size,
+            content_type,
+            cache_control,
+            dynamic,
+            mtime,
+            inode,
+            is_compressible(content_type),
+            media,
+            template,
+            immutable,
+            canonical_url,
+        )
+
+    def _get_media_object(self, file):
+        """Returns whether file is a stored object named by its digest, and
+        the url of the object a link points to. Objects live in their own
+        folder, which uploads cannot name, so a client file is never taken
+        for one."""
+        parent = Path(*file.parts[self.media_path_lvl : -1])
+        if file.is_symlink():
+            target = Path(os.readlink(file))
+            if parent == Path() and self._is_object_path(target.parent, target.stem):
+                return False, "/" + target.as_posix()
+            return False, None
+        return self._is_object_path(parent, file.stem), None
+
+    @staticmethod
+    def _is_object_path(parent, stem):
+        return parent == Path(OBJECTS_FOLDER) and bool(DIGEST_PATTERN.fullmatch(stem))
 
     def path_starts_with(self, first, second):
         """Checks if first path starts with second"""
         first_parts = Path(first).parts
         second_parts = Path(second).parts
+        if len(first_parts) < len(second_parts):
+            return False
         for i in range(len(second_parts)):
             if first_parts[i] != second_parts[i]:
                 return False
@@ -78,25 +321,79 @@ class FileManager:
             # raise WrongPathException(self.media_path)
 
     def get_media_links(self):
-        res = []
-        for url in self.URLS.keys():
-            suffix = Path(url).suffix
-            if suffix and suffix != ".ico":
-                res.append(url)
-        return res
-
-    def save_media(self, data):
-        split = data.split(b"\r\n\r\n")
-        info = split[0]
-        body = split[1]
-        for part in info.split(b"\r\n"):
-            if b'filename="' in part:
-                filename = part.split(b'filename="')[1].split(b'"')[0].decode()
-                break
-        file_path = os.path.join(self.media_path, filename)
-        if os.path.exists(file_path):
-            filename = str(time.time()) + Path(filename).suffix
-            file_path = os.path.join(self.media_path, filename)
-        with open(file_path, "wb") as file:
-            file.write(body)
+        return [Path(url) for url in self.media_catalogue]
+
+    def open_media_upload(self):
+        """Temporary files are created with mode 0600, so uploads get the
+        mode a plain open() would have given them"""
+        file = tempfile.NamedTemporaryFile(
+            "wb", dir=self.media_path, prefix=UPLOAD_PREFIX, delete=False
+        )
+        os.fchmod(file.fileno(), self._upload_mode)
+        return file
+
+    def commit_media_upload(self, file, filename, digest=None):
+        """Atomically moves a finished upload to its media path and indexes
+        it. With content addressed storage the upload is kept once under
+        its hex digest and filename becomes a link to it."""
+        file.close()
+        if self.content_addressed and digest is not None:
+            return self._commit_media_object(file.name, filename, digest)
+        file_path = self._claim_media_path(
+            filename, lambda path: os.link(file.name, path)
+        )
+        os.remove(file.name)
         self.index_media(file_path)
+        return file_path
+
+    def _commit_media_object(self, upload_path, filename, digest):
+        object_name = os.path.join(
+            OBJECTS_FOLDER, digest + Path(filename).suffix.lower()
+        )
+        object_path = os.path.join(self.media_path, object_name)
+        if self._is_stored_object(object_path, digest):
+            os.remove(upload_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(upload_path, object_path)
+            self.index_media(object_path)
+        link_path = os.path.join(self.media_path, filename)
+        if not os.path.islink(link_path) or os.readlink(link_path) != object_name:
+            link_path = self._claim_media_path(
+                filename, lambda path: os.symlink(object_name, path)
+            )
+        self.index_media(link_path)
+        return link_path
+
+    @staticmethod
+    def _is_stored_object(path, digest):
+        """Checks that an upload can be dropped in favour of the object at
+        path: a regular file that still has the content of digest"""
+        try:
+            if not stat.S_ISREG(os.lstat(path).st_mode):
+                return False
+            sha256 = hashlib.sha256()
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 16), b""):
+                    sha256.update(chunk)
+        except OSError:
+            return False
+        return sha256.hexdigest() == digest
+
+    def discard_media_upload(self, file):
+        file.close()
+        os.remove(file.name)
+
+    def _claim_media_path(self, filename, create):
+        """Calls create with the media path for filename, or with a time
+        based name while the path is taken. create must raise
+        FileExistsError instead of replacing a file, so concurrent uploads
+        of one name never overwrite each other."""
+        file_path = os.path.join(self.media_path, filename)
+        while True:
+            try:
+                create(file_path)
+                return file_path
+            except FileExistsError:
+                filename = str(time.time()) + Path(filename).suffix
+                file_path = os.path.join(self.media_path, filename)
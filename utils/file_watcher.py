@@ -0,0 +1,218 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from threading import Event, Thread
+
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+
+CHANGE_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+REMOVE_MASK = IN_DELETE | IN_MOVED_FROM
+WATCH_MASK = CHANGE_MASK | REMOVE_MASK | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyBackend:
+    """Reports changed and removed paths using inotify through ctypes"""
+
+    def __init__(self, roots):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}
+        for root in roots:
+            self._watch_tree(root)
+
+    def read(self, timeout):
+        """Returns (changed, removed, rescan) for the events that arrive
+        within timeout"""
+        changed, removed, rescan = set(), set(), False
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        while ready:
+            data = os.read(self._fd, 65536)
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                rescan |= self._handle_event(wd, mask, name, changed, removed)
+            ready, _, _ = select.select([self._fd], [], [], 0.05)
+        return changed, removed, rescan
+
+    def close(self):
+        os.close(self._fd)
+
+    def _handle_event(self, wd, mask, name, changed, removed):
+        if mask & IN_Q_OVERFLOW:
+            return True
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return False
+        directory = self._watches.get(wd)
+        if directory is None or not name:
+            return False
+        path = os.path.join(directory, os.fsdecode(name))
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                changed.update(self._watch_tree(path))
+            elif mask & REMOVE_MASK:
+                self._unwatch_tree(path)
+                removed.add(path)
+        elif mask & CHANGE_MASK:
+            changed.add(path)
+        elif mask & REMOVE_MASK:
+            removed.add(path)
+        return False
+
+    def _watch_tree(self, root):
+        files = []
+        for directory, _, names in os.walk(root):
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), WATCH_MASK
+            )
+            if wd >= 0:
+                self._watches[wd] = directory
+            files.extend(os.path.join(directory, name) for name in names)
+        return files
+
+    def _unwatch_tree(self, root):
+        prefix = os.path.join(root, "")
+        for wd, directory in list(self._watches.items()):
+            if directory == root or directory.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                self._watches.pop(wd, None)
+
+
+class PollingBackend:
+    """Reports changed and removed paths by comparing stat results of
+    every file between scans"""
+
+    def __init__(self, roots):
+        self._roots = roots
+        self._state = self._scan()
+
+    def read(self, timeout):
+        time.sleep(timeout)
+        state = self._scan()
+        changed = {
+            path for path, stat in state.items() if self._state.get(path) != stat
+        }
+        removed = self._state.keys() - state.keys()
+        self._state = state
+        return changed, removed, False
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        state = {}
+        for root in self._roots:
+            for directory, _, names in os.walk(root):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    state[path] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        return state
+
+
+class FileWatcher:
+    """Keeps the FileManager index current and evicts cached responses
+    of files that changed"""
+
+    def __init__(
+        self, file_manager, response_cache=None, backend="auto", interval=1.0
+    ):
+        self._file_manager = file_manager
+        self._response_cache = response_cache
+        self._interval = interval
+        self._stopped = Event()
+        self._thread = None
+        self._roots = [file_manager.root_path, file_manager.media_path]
+        self._backend = None
+        if backend in {"auto", "inotify"}:
+            try:
+                self._backend = InotifyBackend(self._roots)
+            except (OSError, AttributeError, TypeError):
+                if backend == "inotify":
+                    raise
+        if self._backend is None:
+            self._backend = PollingBackend(self._roots)
+
+    @property
+    def backend(self):
+        return self._backend
+
+    def start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._backend.close()
+
+    def poll(self, timeout):
+        """Waits up to timeout for changes and applies them to the index"""
+        self._apply(*self._backend.read(timeout))
+
+    def _apply(self, changed, removed, rescan):
+        if rescan:
+            self._file_manager.index_files()
+            if self._response_cache is not None:
+                self._response_cache.clear()
+            return
+        paths = changed | removed
+        if not paths:
+            return
+        existing = {path for path in paths if os.path.isfile(path)}
+        urls = self._file_manager.remove_files(paths - existing)
+        urls += self._file_manager.update_files(existing)
+        if self._response_cache is not None:
+            for url in urls:
+                self._response_cache.invalidate(url)
+
+    def _run(self):
+        """Keeps watching after errors. Changes read before a failure are
+        lost, so the next round rebuilds the whole index, and a backend
+        that fails is replaced with polling."""
+        rescan = False
+        while not self._stopped.is_set():
+            try:
+                changed, removed, lost = self._backend.read(self._interval)
+            except Exception:
+                logging.error("File watcher backend failed", exc_info=True)
+                self._use_polling()
+                changed, removed, lost = set(), set(), True
+            try:
+                self._apply(changed, removed, rescan or lost)
+                rescan = False
+            except Exception:
+                logging.error("File watcher exception", exc_info=True)
+                rescan = True
+                self._stopped.wait(self._interval)
+
+    def _use_polling(self):
+        try:
+            self._backend.close()
+        except OSError:
+            pass
+        self._backend = PollingBackend(self._roots)
@@ -0,0 +1,100 @@
+import json
+import os
+
+SNAPSHOT_VERSION = 2
+
+
+class DirectoryEntry:
+    __slots__ = ("mtime_ns", "files", "subdirs")
+
+    def __init__(self, mtime_ns, files, subdirs):
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.subdirs = subdirs
+
+
+class IndexSnapshot:
+    """On-disk listing of a directory tree with the mtime of every
+    directory. A scan only reads and stats directories whose mtime
+    changed, so files that are modified in place in an otherwise
+    unchanged directory keep their old stat until the file watcher sees
+    them."""
+
+    def __init__(self, path):
+        self.path = path
+        self.directories = {}
+        self.rescanned = 0
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+            if data["version"] != SNAPSHOT_VERSION:
+                return
+            directories = {}
+            for directory, (mtime_ns, files, subdirs) in data["directories"].items():
+                directories[directory] = DirectoryEntry(
+                    int(mtime_ns),
+                    [(name, size, mtime, inode) for name, size, mtime, inode in files],
+                    list(subdirs),
+                )
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return
+        self.directories = directories
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "directories": {
+                        path: [entry.mtime_ns, entry.files, entry.subdirs]
+                        for path, entry in self.directories.items()
+                    },
+                },
+                file,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, self.path)
+
+    def scan(self, root):
+        """Returns (path, size, mtime, inode) for every file under root"""
+        directories = {}
+        result = []
+        self.rescanned = 0
+        stack = [str(root)]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            entry = self.directories.get(directory)
+            if entry is None or entry.mtime_ns != mtime_ns:
+                entry = self._scan_directory(directory, mtime_ns)
+                self.rescanned += 1
+            directories[directory] = entry
+            for name, size, mtime, inode in entry.files:
+                result.append((os.path.join(directory, name), size, mtime, inode))
+            stack.extend(os.path.join(directory, name) for name in entry.subdirs)
+        self.directories = directories
+        return result
+
+    def _scan_directory(self, directory, mtime_ns):
+        files = []
+        subdirs = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.name, stat.st_size, stat.st_mtime, stat.st_ino))
+        return DirectoryEntry(mtime_ns, files, subdirs)
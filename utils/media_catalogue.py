@@ -0,0 +1,56 @@
+from bisect import bisect_left
+from threading import Lock
+
+PREFIX_END = "\U0010ffff"
+
+
+class MediaCatalogue:
+    """Sorted list of media urls that is updated as files are indexed.
+    The version changes with every update so rendered listings can be
+    cached until the next upload."""
+
+    def __init__(self, urls=()):
+        self._urls = sorted(urls)
+        self._lock = Lock()
+        self.version = 0
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __iter__(self):
+        return iter(list(self._urls))
+
+    def __contains__(self, url):
+        i = bisect_left(self._urls, url)
+        return i < len(self._urls) and self._urls[i] == url
+
+    def reset(self, urls):
+        with self._lock:
+            self._urls = sorted(urls)
+            self.version += 1
+
+    def update(self, added=(), removed=()):
+        with self._lock:
+            changed = False
+            for url in removed:
+                i = bisect_left(self._urls, url)
+                if i < len(self._urls) and self._urls[i] == url:
+                    del self._urls[i]
+                    changed = True
+            for url in added:
+                i = bisect_left(self._urls, url)
+                if i == len(self._urls) or self._urls[i] != url:
+                    self._urls.insert(i, url)
+                    changed = True
+            if changed:
+                self.version += 1
+
+    def page(self, prefix="", offset=0, limit=100):
+        """Returns (version, total, urls) for urls that start with prefix,
+        skipping offset of them and taking at most limit"""
+        with self._lock:
+            start = bisect_left(self._urls, prefix)
+            end = bisect_left(self._urls, prefix + PREFIX_END, start)
+            first = min(start + offset, end)
+            urls = self._urls[first : min(first + limit, end)]
+            return self.version, end - start, urls
@@ -0,0 +1,126 @@
+from bisect import bisect_left
+from threading import Lock, local
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+STAGES = ("recv", "parse", "generate", "send")
+STAGE_HISTOGRAM = "http_stage_duration_seconds"
+
+RESPONSES = "http_responses_total"
+SENT_BYTES = "http_sent_bytes_total"
+ACTIVE_CONNECTIONS = "http_connections_active"
+IDLE_CONNECTIONS = "http_connections_idle"
+TYPES = {
+    RESPONSES: "counter",
+    SENT_BYTES: "counter",
+    ACTIVE_CONNECTIONS: "gauge",
+    IDLE_CONNECTIONS: "gauge",
+}
+
+
+class ThreadMetrics:
+    """Values written by a single thread, so updates need no lock"""
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self, buckets_count):
+        self.counters = {}
+        self.histograms = {
+            stage: [0.0] + [0] * (buckets_count + 1) for stage in STAGES
+        }
+
+
+class Metrics:
+    """Collects stage timings and counters per thread and renders their
+    sums in Prometheus text format. Gauges are counters that also go
+    down, so a connection may be opened and closed by different threads."""
+
+    def __init__(self, buckets=BUCKETS):
+        self._buckets = buckets
+        self._local = local()
+        self._threads = []
+        self._threads_lock = Lock()
+
+    def observe(self, stage, seconds):
+        histogram = self._get_thread_metrics().histograms[stage]
+        histogram[0] += seconds
+        histogram[bisect_left(self._buckets, seconds) + 1] += 1
+
+    def inc(self, name, value=1):
+        counters = self._get_thread_metrics().counters
+        counters[name] = counters.get(name, 0) + value
+
+    def collect(self):
+        """Returns the counters and histograms summed over all threads.
+        A histogram is [sum, count per bucket..., count above the last]."""
+        with self._threads_lock:
+            threads = list(self._threads)
+        counters = {}
+        histograms = {
+            stage: [0.0] + [0] * (len(self._buckets) + 1) for stage in STAGES
+        }
+        for thread_metrics in threads:
+            for name, value in list(thread_metrics.counters.items()):
+                counters[name] = counters.get(name, 0) + value
+            for stage, histogram in thread_metrics.histograms.items():
+                total = histograms[stage]
+                for i, value in enumerate(histogram):
+                    total[i] += value
+        return counters, histograms
+
+    def render(self, extra=()):
+        """Renders collected values and extra (name, type, value) samples"""
+        counters, histograms = self.collect()
+        lines = [f"# TYPE {STAGE_HISTOGRAM} histogram"]
+        for stage, histogram in histograms.items():
+            labels = f'stage="{stage}"'
+            cumulative = 0
+            for le, count in zip(self._buckets, histogram[1:]):
+                cumulative += count
+                lines.append(
+                    f'{STAGE_HISTOGRAM}_bucket{{{labels},le="{le}"}} {cumulative}'
+                )
+            cumulative += histogram[-1]
+            lines.append(f'{STAGE_HISTOGRAM}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"{STAGE_HISTOGRAM}_sum{{{labels}}} {histogram[0]}")
+            lines.append(f"{STAGE_HISTOGRAM}_count{{{labels}}} {cumulative}")
+
+        samples = {}
+        for name, value in counters.items():
+            samples.setdefault(name.partition("{")[0], []).append((name, value))
+        for name in TYPES:
+            samples.setdefault(name, [(name, 0)])
+        types = dict(TYPES)
+        for name, metric_type, value in extra:
+            base_name = name.partition("{")[0]
+            types[base_name] = metric_type
+            samples.setdefault(base_name, []).append((name, value))
+        for base_name, values in samples.items():
+            lines.append(f"# TYPE {base_name} {types.get(base_name, 'counter')}")
+            lines.extend(f"{name} {value}" for name, value in sorted(values))
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _get_thread_metrics(self):
+        thread_metrics = getattr(self._local, "metrics", None)
+        if thread_metrics is None:
+            thread_metrics = ThreadMetrics(len(self._buckets))
+            self._local.metrics = thread_metrics
+            with self._threads_lock:
+                self._threads.append(thread_metrics)
+        return thread_metrics
@@ -0,0 +1,139 @@
+import hashlib
+import os
+
+from models.exceptions import BadRequestException
+
+PREAMBLE = 0
+DELIMITER = 1
+HEADERS = 2
+BODY = 3
+DONE = 4
+
+
+class MultipartParser:
+    """Incremental multipart/form-data parser. File parts are written to
+    temporary files in media as the bytes arrive and committed when their
+    closing boundary is seen, so only a chunk and a boundary tail are kept
+    in memory. For content addressed storage the parts are hashed as they
+    are written."""
+
+    def __init__(self, boundary, file_manager, headers_limit=8192):
+        self._file_manager = file_manager
+        self._headers_limit = headers_limit
+        self._delimiter = b"\r\n--" + boundary
+        self._buffer = bytearray(b"\r\n")
+        self._state = PREAMBLE
+        self._file = None
+        self._filename = None
+        self._digest = None
+        self.saved = []
+
+    @property
+    def done(self):
+        return self._state == DONE
+
+    def feed(self, data):
+        self._buffer += data
+        progress = True
+        while progress and self._state != DONE:
+            if self._state == PREAMBLE:
+                progress = self._skip_preamble()
+            elif self._state == DELIMITER:
+                progress = self._read_delimiter_end()
+            elif self._state == HEADERS:
+                progress = self._read_headers()
+            else:
+                progress = self._read_body()
+
+    def close(self):
+        """Discards a part that was not terminated by a boundary"""
+        if self._file is not None:
+            self._file_manager.discard_media_upload(self._file)
+            self._file = None
+
+    def _skip_preamble(self):
+        index = self._buffer.find(self._delimiter)
+        if index == -1:
+            del self._buffer[: -len(self._delimiter)]
+            return False
+        del self._buffer[: index + len(self._delimiter)]
+        self._state = DELIMITER
+        return True
+
+    def _read_delimiter_end(self):
+        if len(self._buffer) < 2:
+            return False
+        if self._buffer[:2] == b"--":
+            self._buffer.clear()
+            self._state = DONE
+            return False
+        line_end = self._buffer.find(b"\r\n")
+        if line_end == -1:
+            return False
+        del self._buffer[: line_end + 2]
+        self._state = HEADERS
+        return True
+
+    def _read_headers(self):
+        end = self._buffer.find(b"\r\n\r\n")
+        if end == -1:
+            if len(self._buffer) > self._headers_limit:
+                raise BadRequestException("multipart headers are too large")
+            return False
+        headers = bytes(self._buffer[:end])
+        del self._buffer[: end + 4]
+        self._filename = self._parse_filename(headers)
+        if self._filename:
+            self._file = self._file_manager.open_media_upload()
+            if self._file_manager.content_addressed:
+                self._digest = hashlib.sha256()
+        self._state = BODY
+        return True
+
+    def _read_body(self):
+        index = self._buffer.find(self._delimiter)
+        if index == -1:
+            safe = len(self._buffer) - len(self._delimiter) + 1
+            if safe > 0:
+                self._write(self._buffer[:safe])
+                del self._buffer[:safe]
+            return False
+        self._write(self._buffer[:index])
+        del self._buffer[: index + len(self._delimiter)]
+        if self._file is not None:
+            digest = None if self._digest is None else self._digest.hexdigest()
+            self.saved.append(
+                self._file_manager.commit_media_upload(
+                    self._file, self._filename, digest
+                )
+            )
+            self._file = None
+            self._digest = None
+        self._state = DELIMITER
+        return True
+
+    def _write(self, data):
+        if self._file is not None:
+            self._file.write(data)
+            if self._digest is not None:
+                self._digest.update(data)
+
+    @staticmethod
+    def _parse_filename(headers):
+        for line in headers.split(b"\r\n"):
+            if not line.lower().startswith(b"content-disposition:"):
+                continue
+            if b'filename="' in line:
+                filename = line.split(b'filename="')[1].split(b'"')[0].decode()
+                return os.path.basename(filename)
+        return None
+
+
+def parse_boundary(content_type):
+    if not content_type or not content_type.startswith("multipart/form-data"):
+        raise BadRequestException(content_type)
+    for parameter in content_type.split(";")[1:]:
+        name, _, value = parameter.strip().partition("=")
+        if name.lower() == "boundary" and value:
+            return value.strip('"').encode("utf-8")
+    raise BadRequestException(content_type)
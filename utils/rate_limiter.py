@@ -0,0 +1,149 @@
+import math
+import time
+from threading import Event, Lock, Thread
+
+ALGORITHMS = ("sliding-window", "token-bucket")
+
+
+class ClientState:
+    __slots__ = ("connections", "last_seen", "window_start", "current", "previous")
+
+    def __init__(self, now):
+        self.connections = 0
+        self.last_seen = now
+        self.window_start = now
+        self.current = 0.0
+        self.previous = 0.0
+
+
+class RateLimiter:
+    """Limits requests per IP to limit per span seconds and counts open
+    connections. State of IPs without connections is dropped after
+    idle_timeout seconds."""
+
+    def __init__(
+        self,
+        limit,
+        span,
+        algorithm="sliding-window",
+        shards_count=16,
+        idle_timeout=60,
+    ):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(algorithm)
+        self._limit = limit
+        self._span = span
+        self._token_bucket = algorithm == "token-bucket"
+        self._check = (
+            self._check_token_bucket
+            if self._token_bucket
+            else self._check_sliding_window
+        )
+        self._shards = [(Lock(), {}) for _ in range(shards_count)]
+        self._idle_timeout = idle_timeout
+        self._stopped = Event()
+        self._thread = None
+
+    def __len__(self):
+        return sum(len(clients) for _, clients in self._shards)
+
+    def check(self, ip):
+        """Counts a request and returns 0 when it is allowed or the number
+        of seconds to wait before the next one"""
+        lock, clients = self._shard(ip)
+        now = time.monotonic()
+        with lock:
+            state = clients.get(ip)
+            if state is None:
+                state = clients[ip] = self._create_state(now)
+            state.last_seen = now
+            return self._check(state, now)
+
+    def connect(self, ip):
+        """Returns the number of open connections of ip including this one"""
+        lock, clients = self._shard(ip)
+        now = time.monotonic()
+        with lock:
+            state = clients.get(ip)
+            if state is None:
+                state = clients[ip] = self._create_state(now)
+            state.connections += 1
+            state.last_seen = now
+            return state.connections
+
+    def disconnect(self, ip):
+        lock, clients = self._shard(ip)
+        with lock:
+            state = clients.get(ip)
+            if state is not None:
+                state.connections -= 1
+                state.last_seen = time.monotonic()
+
+    def evict(self):
+        """Drops IPs without connections that were idle for idle_timeout"""
+        deadline = time.monotonic() - self._idle_timeout
+        for lock, clients in self._shards:
+            with lock:
+                idle = [
+                    ip
+                    for ip, state in clients.items()
+                    if state.connections <= 0 and state.last_seen < deadline
+                ]
+                for ip in idle:
+                    del clients[ip]
+
+    def start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self._idle_timeout / 2):
+            self.evict()
+
+    def _shard(self, ip):
+        return self._shards[hash(ip) % len(self._shards)]
+
+    def _create_state(self, now):
+        state = ClientState(now)
+        if self._token_bucket:
+            state.current = float(self._limit)
+        return state
+
+    def _check_sliding_window(self, state, now):
+        """Weights the count of the previous window by the part of it that
+        still falls into the last span seconds"""
+        elapsed = now - state.window_start
+        if elapsed >= self._span:
+            windows = int(elapsed // self._span)
+            state.previous = state.current if windows == 1 else 0.0
+            state.current = 0.0
+            state.window_start += windows * self._span
+            elapsed = now - state.window_start
+        weight = (self._span - elapsed) / self._span
+        if state.previous * weight + state.current < self._limit:
+            state.current += 1
+            return 0
+        if state.current >= self._limit:
+            wait = self._span - elapsed
+            wait += self._span * (1 - self._limit / state.current)
+        else:
+            free = (self._limit - state.current) / state.previous
+            wait = self._span * (1 - free) - elapsed
+        return max(1, math.ceil(wait))
+
+    def _check_token_bucket(self, state, now):
+        """state.current holds the tokens, refilled at limit per span"""
+        rate = self._limit / self._span
+        state.current = min(
+            self._limit, state.current + (now - state.window_start) * rate
+        )
+        state.window_start = now
+        if state.current >= 1:
+            state.current -= 1
+            return 0
+        return max(1, math.ceil((1 - state.current) / rate))
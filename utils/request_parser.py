@@ -1,39 +1,101 @@
-from pathlib import Path
-
+from models.exceptions import BadRequestException
 from models.request import Request
+from utils.compression import negotiate_encoding
+from utils.multipart_parser import MultipartParser, parse_boundary
+
+STRING_HEADERS = {
+    b"connection": "connection",
+    b"content-type": "content_type",
+    b"user-agent": "user_agent",
+    b"if-none-match": "if_none_match",
+    b"if-modified-since": "if_modified_since",
+    b"range": "range",
+    b"if-range": "if_range",
+}
+HEADER_LENGTHS = {
+    len(name) for name in (*STRING_HEADERS, b"content-length", b"accept-encoding")
+}
 
 
 class RequestParser:
     def __init__(self, file_manager):
         self._file_manager = file_manager
 
-    def parse_request(self, data: str):
-        headers = data.split("\r\n")
-        first_line = headers[0].split()
-        request = Request(
-            first_line[0], first_line[1], first_line[2], Path(first_line[1]).name
-        )
-        for i in range(1, len(headers)):
-            if headers[i].startswith("Connection:"):
-                request.connection = headers[i].split(":")[1].strip()
-            elif headers[i].startswith("Content-Length:"):
-                request.content_length = int(headers[i].split(":")[1].strip())
-            elif headers[i].startswith("User-Agent:"):
-                request.user_agent = headers[i].split(":")[1].strip()
+    def parse_request(self, data):
+        """Parses the request line and headers from bytes, a memoryview or
+        str. Only the headers the server uses are decoded; names of other
+        headers are skipped by their length."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        elif isinstance(data, memoryview):
+            data = data.tobytes()
+        end = data.find(b"\r\n")
+        if end == -1:
+            end = len(data)
+        request = self._parse_request_line(data[:end])
+        size = len(data)
+        position = end + 2
+        while position < size:
+            end = data.find(b"\r\n", position)
+            if end == -1:
+                end = size
+            colon = data.find(b":", position, end)
+            if colon == -1:
+                if end > position:
+                    raise BadRequestException(data[position:end])
+            elif colon - position in HEADER_LENGTHS:
+                self._parse_header(
+                    request, data[position:colon].lower(), data[colon + 1 : end]
+                )
+            position = end + 2
         return request
 
+    def _parse_request_line(self, line):
+        parts = line.split()
+        if len(parts) != 3 or not parts[2].startswith(b"HTTP/"):
+            raise BadRequestException(line)
+        try:
+            target = parts[1].decode("utf-8")
+            url, _, query = target.partition("?")
+            return Request(
+                parts[0].decode("ascii"),
+                url,
+                parts[2].decode("ascii"),
+                query_string=query,
+            )
+        except UnicodeDecodeError:
+            raise BadRequestException(line) from None
+
+    def _parse_header(self, request, name, value):
+        field = STRING_HEADERS.get(name)
+        if field is not None:
+            setattr(request, field, value.strip().decode("latin-1"))
+        elif name == b"content-length":
+            try:
+                request.content_length = int(value)
+            except ValueError:
+                raise BadRequestException(value) from None
+            if request.content_length < 0:
+                raise BadRequestException(value)
+        elif name == b"accept-encoding":
+            request.encoding = negotiate_encoding(value.decode("latin-1"))
+
     def parse_request_body(self, request_info, body):
         if not body:
             return
-        if request_info.page_name == "uploaded_image":
-            self.parse_media(body)
-        elif request_info.page_name == "logger_name":
+        if request_info.page_name == "logger_name":
             request_info.login_body = self.parse_login(body)
 
-    def parse_media(self, data):
-        self._file_manager.save_media(data)
+    def create_media_parser(self, request_info):
+        boundary = parse_boundary(request_info.content_type)
+        return MultipartParser(boundary, self._file_manager)
 
     def parse_login(self, data):
+        """BadRequestException is raised when a field is not name=value or
+        name or surname is missing, so the client gets a 400"""
         replaced = data.replace("+", " ")
-        info_dict = dict(pair.split("=") for pair in replaced.split("&") if pair)
-        return f"{info_dict['name']} {info_dict['surname']}"
+        try:
+            info_dict = dict(pair.split("=") for pair in replaced.split("&") if pair)
+            return f"{info_dict['name']} {info_dict['surname']}"
+        except (ValueError, KeyError):
+            raise BadRequestException(data) from None
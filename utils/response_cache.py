@@ -0,0 +1,118 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "expires")
+
+    def __init__(self, value, size, expires):
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+
+class CacheShard:
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.variants = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def pop(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        url_variants = self.variants[key[0]]
+        url_variants.discard(key[1])
+        if not url_variants:
+            del self.variants[key[0]]
+        return entry
+
+
+class ResponseCache:
+    """LRU cache of responses bounded by entry count and total bytes.
+    Entries are keyed by url and a variant (method, status, ...); all
+    variants of a url live in one shard, each shard has its own lock."""
+
+    def __init__(self, max_entries, max_bytes, shards_count=8, ttl=0):
+        shards_count = max(1, min(shards_count, max_entries))
+        self._ttl = ttl
+        self._shards = [
+            CacheShard(
+                max(1, max_entries // shards_count),
+                max(1, max_bytes // shards_count),
+            )
+            for _ in range(shards_count)
+        ]
+
+    @property
+    def max_entry_bytes(self):
+        """Largest response a shard can hold"""
+        return self._shards[0].max_bytes
+
+    def get(self, url, variant):
+        shard = self._get_shard(url)
+        key = (url, variant)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is not None and entry.expires and entry.expires < time.time():
+                shard.pop(key)
+                entry = None
+            if entry is None:
+                shard.misses += 1
+                return None
+            shard.entries.move_to_end(key)
+            shard.hits += 1
+            return entry.value
+
+    def put(self, url, variant, value, size):
+        shard = self._get_shard(url)
+        if size > shard.max_bytes:
+            return
+        key = (url, variant)
+        expires = time.time() + self._ttl if self._ttl else 0
+        with shard.lock:
+            if key in shard.entries:
+                shard.pop(key)
+            while shard.entries and (
+                len(shard.entries) >= shard.max_entries
+                or shard.bytes + size > shard.max_bytes
+            ):
+                shard.pop(next(iter(shard.entries)))
+                shard.evictions += 1
+            shard.entries[key] = CacheEntry(value, size, expires)
+            shard.variants.setdefault(url, set()).add(variant)
+            shard.bytes += size
+
+    def invalidate(self, url):
+        """Removes every cached variant of url"""
+        shard = self._get_shard(url)
+        with shard.lock:
+            for variant in list(shard.variants.get(url, ())):
+                shard.pop((url, variant))
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.variants.clear()
+                shard.bytes = 0
+
+    def stats(self):
+        result = {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}
+        for shard in self._shards:
+            with shard.lock:
+                result["hits"] += shard.hits
+                result["misses"] += shard.misses
+                result["evictions"] += shard.evictions
+                result["entries"] += len(shard.entries)
+                result["bytes"] += shard.bytes
+        return result
+
+    def _get_shard(self, url):
+        return self._shards[hash(url) % len(self._shards)]
@@ -1,4 +1,29 @@
+import html
+import os
+import uuid
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from urllib.parse import urlencode
+
+from models.response import FileRange, Response
+from utils.byte_ranges import parse_range
+from utils.compression import compress, compress_stream
+
+STATUS_TEXT = {
+    200: "OK",
+    206: "Partial Content",
+    304: "Not Modified",
+    400: "Bad request",
+    404: "Not found",
+    405: "Method not allowed",
+    408: "Request timeout",
+    429: "Too many requests",
+    416: "Range not satisfiable",
+    431: "Request header fields too large",
+    503: "Service unavailable",
+}
+MEDIA_LISTINGS_LIMIT = 256
+SENDFILE_MIN_SIZE = 1 << 14
 
 
 class ResponseGenerator:
@@ -7,100 +32,344 @@ class ResponseGenerator:
         indexer,
         keep_alive_max_requests,
         browser_caching,
-        cash_list,
+        response_cache,
         keep_alive_timeout,
+        sendfile_min_size=SENDFILE_MIN_SIZE,
+        compression_min_size=None,
+        compression_level=6,
+        download_page_size=100,
     ):
         self._indexer = indexer
         self._browser_caching = browser_caching
-        self._server_cash_list = cash_list
+        self._response_cache = response_cache
         self._keep_alive_timeout = keep_alive_timeout
         self._keep_alive_max_requests = keep_alive_max_requests
+        self._sendfile_min_size = sendfile_min_size
+        self._compression_min_size = compression_min_size
+        self._compression_level = compression_level
+        self._download_page_size = download_page_size
+        self._media_listings = (None, {})
+        self._stream_handlers = {"/download": self._stream_download}
+        self._close_header = b"Connection: close\r\n\r\n"
+        self._keep_alive_headers = [
+            self._encode_keep_alive_header(max_req)
+            for max_req in range(keep_alive_max_requests + 1)
+        ]
+        self._error_responses = {
+            code: self._generate_error_response(code)
+            for code in STATUS_TEXT
+            if code >= 400
+        }
 
     def generate_response(self, request_info):
-        url = request_info.url
-        if self._server_cash_list and self._server_cash_list.contains(url):
-            return self._server_cash_list.get(url)
+        route = self._indexer.get_route(request_info.url)
+        code = self._get_status_code(
+            request_info.method, route, request_info.too_many_requests
+        )
+        if code == 429:
+            stable = self._error_responses[429]
+            retry_after = f"Retry-After: {request_info.too_many_requests}\r\n"
+            response = Response(
+                429,
+                stable.head + retry_after.encode("utf-8"),
+                stable.body,
+                connection=self._generate_connection_header(request_info),
+            )
+            return response, 429
+        encoding = None
+        if code == 200:
+            encoding = self._select_encoding(request_info, route)
+        if code == 200 and self._is_not_modified(request_info, route, encoding):
+            if encoding is None:
+                head = route.not_modified_header
+            else:
+                head = route.build_not_modified_header(route.get_etag(encoding))
+            response = Response(
+                304, head, connection=self._generate_connection_header(request_info)
+            )
+            return response, 304
+        if (
+            code == 200
+            and encoding is None
+            and route.media
+            and request_info.range is not None
+            and request_info.method == "GET"
+        ):
+            response = self._generate_range_response(request_info, route)
+            if response is not None:
+                return response, response.code
+        cacheable = (
+            self._response_cache is not None
+            and code == 200
+            and request_info.method == "GET"
+            and not route.dynamic
+            and route.size < self._sendfile_min_size
+            and route.size <= self._response_cache.max_entry_bytes
+        )
+        variant = (request_info.method, code, encoding)
+        stable = self._response_cache.get(route.url, variant) if cacheable else None
+        if stable is None:
+            stable = self._generate_stable_response(
+                code, route, request_info, encoding
+            )
+            if cacheable:
+                self._response_cache.put(
+                    route.url, variant, stable, len(stable.head) + len(stable.body)
+                )
 
-        response = []
-        status_header, code = self._generate_status_header(
-            request_info.method, url, request_info.too_many_requests
+        connection_header = self._generate_connection_header(request_info)
+        response = Response(
+            code,
+            stable.head,
+            stable.body,
+            stable.parts,
+            connection_header,
+            stable.chunks,
         )
-        response.append(status_header)
-        response.append(self._generate_content_type_header(url, code))
-        response.append(self._generate_caching_header(url))
-        response.append(self._generate_connection_header(request_info))
-        content = self._generate_body(code, request_info)
-        response.append(self._generate_content_length_header(content))
-        response.append("\n")
-        response_encoded = "".join(response).encode("utf-8")
-        result = response_encoded + content
-        if self._server_cash_list and url not in {"/logger_name", "/download"}:
-            self._server_cash_list.put(url, result, code)
-        return result, code
+        return response, code
+
+    def add_stream_handler(self, url, handler):
+        """Serves the dynamic page at url with handler(request_info), a
+        generator of bytes. HTTP/1.1 clients get the pieces as they are
+        produced with chunked transfer encoding."""
+        self._stream_handlers[url] = handler
+
+    def generate_error_response(self, code, retry_after=None):
+        """Returns a prebuilt response for a request that could not be
+        parsed or served. The connection is always closed after it."""
+        stable = self._error_responses[code]
+        head = stable.head
+        if retry_after is not None:
+            head += f"Retry-After: {retry_after}\r\n".encode("utf-8")
+        return Response(code, head, stable.body, connection=self._close_header)
+
+    def generate_text_response(self, request_info, content_type, content):
+        """Builds a 200 response for content produced by the server itself
+        rather than by a route"""
+        head = (
+            f"HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {content_type}\r\n"
+            "Cache-Control: no-store\r\n"
+        ).encode("utf-8") + self._generate_content_length_header(len(content))
+        connection = self._generate_connection_header(request_info)
+        return Response(200, head, content, connection=connection)
+
+    def _generate_stable_response(self, code, route, request_info, encoding=None):
+        """Builds the status line, the headers that do not depend on the
+        connection and the body"""
+        if code != 200:
+            return self._error_responses[code]
+        if not route.dynamic:
+            with open(route.path, "rb") as file:
+                stat = os.fstat(file.fileno())
+                route = route.refresh(stat.st_size, stat.st_mtime, stat.st_ino)
+                if route.size >= self._sendfile_min_size:
+                    return Response(
+                        code,
+                        route.header,
+                        parts=[FileRange(route.path, 0, route.size)],
+                    )
+                content = file.read()
+            route = route.refresh(len(content), route.mtime, route.inode)
+            if encoding is None:
+                return Response(code, route.header, content)
+            content = compress(content, encoding, self._compression_level)
+            head = route.build_encoded_header(encoding, len(content))
+            return Response(code, head, content)
+        handler = self._stream_handlers.get(route.url)
+        if handler is not None:
+            return self._generate_stream_response(
+                code, route, request_info, encoding, handler(request_info)
+            )
+        content = self._generate_body(route, request_info)
+        head = route.header
+        if encoding is not None and len(content) >= self._compression_min_size:
+            content = compress(content, encoding, self._compression_level)
+            head += f"Content-Encoding: {encoding}\r\n".encode("utf-8")
+        head += self._generate_content_length_header(len(content))
+        return Response(code, head, content)
+
+    def _generate_stream_response(self, code, route, request_info, encoding, chunks):
+        """Sends the body chunked, or joins it for HTTP/1.0 clients that
+        do not support chunked transfer encoding"""
+        head = route.header
+        if encoding is not None:
+            chunks = compress_stream(chunks, encoding, self._compression_level)
+            head += f"Content-Encoding: {encoding}\r\n".encode("utf-8")
+        if request_info.http_version == "HTTP/1.1":
+            head += b"Transfer-Encoding: chunked\r\n"
+            return Response(code, head, chunks=chunks)
+        content = b"".join(chunks)
+        head += self._generate_content_length_header(len(content))
+        return Response(code, head, content)
+
+    def _generate_range_response(self, request_info, route):
+        """Builds a 206 response with the requested byte ranges read from
+        the file with sendfile, a 416 response, or returns None when the
+        whole file should be sent"""
+        if_range = request_info.if_range
+        if if_range is not None and if_range not in (route.etag, route.last_modified):
+            return None
+        ranges = parse_range(request_info.range, route.size)
+        if ranges is None:
+            return None
+        connection = self._generate_connection_header(request_info)
+        if not ranges:
+            stable = self._error_responses[416]
+            content_range = f"Content-Range: bytes */{route.size}\r\n"
+            head = stable.head + content_range.encode("utf-8")
+            return Response(416, head, stable.body, connection=connection)
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            head = route.build_partial_header(
+                route.content_type,
+                f"Content-Range: bytes {start}-{end}/{route.size}\r\n",
+                end - start + 1,
+            )
+            parts = [FileRange(route.path, start, end - start + 1)]
+            return Response(206, head, parts=parts, connection=connection)
+
+        boundary = uuid.uuid4().hex
+        parts = []
+        length = 0
+        for start, end in ranges:
+            part_head = (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {route.content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{route.size}\r\n\r\n"
+            ).encode("utf-8")
+            parts.append(part_head)
+            parts.append(FileRange(route.path, start, end - start + 1))
+            length += len(part_head) + end - start + 1
+        parts.append(f"\r\n--{boundary}--\r\n".encode("utf-8"))
+        length += len(parts[-1])
+        head = route.build_partial_header(
+            f"multipart/byteranges; boundary={boundary}", "", length
+        )
+        return Response(206, head, parts=parts, connection=connection)
+
+    def _select_encoding(self, request_info, route):
+        """Compressed variants are kept in memory, so files that are
+        streamed with sendfile are always sent as is"""
+        if (
+            self._compression_min_size is None
+            or request_info.encoding is None
+            or not route.compressible
+        ):
+            return None
+        if route.dynamic:
+            return request_info.encoding
+        if self._compression_min_size <= route.size < self._sendfile_min_size:
+            return request_info.encoding
+        return None
+
+    def _generate_error_response(self, code):
+        content = self._generate_error_body(code)
+        head = (
+            f"HTTP/1.1 {code} {STATUS_TEXT[code]}\r\n"
+            "Content-Type: text/html\r\n"
+            "Cache-Control: no-store\r\n"
+        ).encode("utf-8") + self._generate_content_length_header(len(content))
+        return Response(code, head, content)
 
     def _generate_connection_header(self, request_info):
-        max_req = self._keep_alive_max_requests - request_info.requests_count
         if not request_info.connection or request_info.method == "POST":
-            return "Connection: close\n"
-        else:
-            return (
-                f"Connection: keep-alive\nKeep-Alive: "
-                f"timeout={self._keep_alive_timeout}, "
-                f"max={max_req}\n"
-            )
+            return self._close_header
+        max_req = self._keep_alive_max_requests - request_info.requests_count
+        return self._keep_alive_headers[max(0, max_req)]
 
-    def _generate_content_length_header(self, content):
-        return f"Content-Length: {len(content)}\n"
+    def _encode_keep_alive_header(self, max_req):
+        return (
+            f"Connection: keep-alive\r\nKeep-Alive: "
+            f"timeout={self._keep_alive_timeout}, "
+            f"max={max_req}\r\n\r\n"
+        ).encode("utf-8")
 
-    def _generate_caching_header(self, url):
-        cache_condition = not self._browser_caching or url in {
-            "/logger_name",
-            "/download",
-        }
-        cache = "no-store" if cache_condition else "public, max-age=86400"
-        return "Cache-Control: " + cache + "\n"
-
-    def _generate_content_type_header(sefl, url, code):
-        suffix = Path(url).suffix
-        content_type = ""
-        if not suffix or code != 200:
-            content_type = "text/html"
-        if suffix in {".jpg", ".jpeg"}:
-            content_type = "image/jpeg"
-        elif suffix == ".png":
-            content_type = "image/png"
-        elif suffix == ".gif":
-            content_type = "image/gif"
-        return f"Content-Type: {content_type}\n"
-
-    def _generate_status_header(self, method, url, tmr):
+    def _generate_content_length_header(self, length):
+        return f"Content-Length: {length}\r\n".encode("utf-8")
+
+    def _is_not_modified(self, request_info, route, encoding=None):
+        if route.dynamic or request_info.method != "GET":
+            return False
+        if request_info.if_none_match is not None:
+            etag = route.get_etag(encoding)
+            for tag in request_info.if_none_match.split(","):
+                tag = tag.strip()
+                if tag == "*" or tag.removeprefix("W/") == etag:
+                    return True
+            return False
+        if request_info.if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(request_info.if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return int(route.mtime) <= since.timestamp()
+        return False
+
+    def _get_status_code(self, method, route, tmr):
         if tmr:
-            return "HTTP/1.1 429 Too many requests\n", 429
+            return 429
         if method not in {"POST", "GET"}:
-            return "HTTP/1.1 405 Method not allowed\n", 405
-        if not self._indexer.contains(url):
-            return "HTTP/1.1 404 Not found\n", 404
-        return "HTTP/1.1 200 OK\n", 200
-
-    def _generate_body(self, code, request_info):
-        if code == 404:
-            return "<h1>404</h1><p>Not found</p>\n".encode("utf-8")
-        if code == 405:
-            return "<h1>405</h1><p>Method not allowed</p>\n".encode("utf-8")
-        if code == 429:
-            return "<h1>429</h1><p>Too many requests</p>\n".encode("utf-8")
-        if code == 200:
-            page_code = self._indexer.get_page_code(request_info.url)
-            page = Path(request_info.url).name
-            suffix = Path(request_info.url).suffix
-            if request_info.method == "POST" and page == "logger_name":
-                page_code = page_code.format(request_info.login_body)
-            if page == "download":
-                page_code = page_code.format(self._generate_media_body())
-            return page_code if suffix else page_code.encode("utf-8")
-
-    def _generate_media_body(self):
+            return 405
+        if route is None:
+            return 404
+        return 200
+
+    def _generate_body(self, route, request_info):
+        login_body = None
+        if request_info.method == "POST" and request_info.page_name == "logger_name":
+            login_body = request_info.login_body
+        return route.template.render(login=login_body)
+
+    def _stream_download(self, request_info):
+        """Yields the download page template around the media listing"""
+        route = self._indexer.get_route(request_info.url)
+        return route.template.render_chunks(
+            links=self._generate_media_body(request_info)
+        )
+
+    def _generate_error_body(self, code):
+        return f"<h1>{code}</h1><p>{STATUS_TEXT[code]}</p>\n".encode("utf-8")
+
+    def _generate_media_body(self, request_info):
+        """Renders one page of the media catalogue. Links to stored objects
+        point to their immutable digest urls. Rendered pages are kept until
+        the catalogue changes."""
+        prefix = request_info.query.get("prefix", "")
+        if prefix and not prefix.startswith("/"):
+            prefix = "/" + prefix
+        try:
+            page = max(1, int(request_info.query.get("page", 1)))
+        except ValueError:
+            page = 1
+        catalogue = self._indexer.media_catalogue
+        version, listings = self._media_listings
+        if version != catalogue.version:
+            version, listings = catalogue.version, {}
+            self._media_listings = (version, listings)
+        listing = listings.get((prefix, page))
+        if listing is not None:
+            return listing
+
+        size = self._download_page_size
+        page_version, total, urls = catalogue.page(prefix, (page - 1) * size, size)
         result = []
-        for url in self._indexer.get_media_links():
-            result.append(f'<a href="{url}">{Path(url).name}</a>\n')
-        return "".join(result)
+        for url in urls:
+            name = html.escape(Path(url).name)
+            route = self._indexer.get_route(url)
+            if route is not None and route.canonical_url is not None:
+                url = route.canonical_url
+            result.append(f'<a href="{html.escape(url)}">{name}</a>\n')
+        if page > 1:
+            query = urlencode({"prefix": prefix, "page": page - 1})
+            result.append(f'<a href="download?{html.escape(query)}">Previous</a>\n')
+        if page * size < total:
+            query = urlencode({"prefix": prefix, "page": page + 1})
+            result.append(f'<a href="download?{html.escape(query)}">Next</a>\n')
+        listing = "".join(result)
+        if page_version == version:
+            if len(listings) >= MEDIA_LISTINGS_LIMIT:
+                listings.clear()
+            listings[(prefix, page)] = listing
+        return listing
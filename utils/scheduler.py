@@ -0,0 +1,63 @@
+import logging
+import queue
+from threading import Lock, Thread
+
+
+class Lane:
+    """Bounded queue of work items served by the lane's own worker
+    threads with handler(item)"""
+
+    def __init__(self, name, workers_count, queue_limit, handler):
+        self.name = name
+        self._workers_count = workers_count
+        self._queue = queue.Queue(queue_limit)
+        self._handler = handler
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    @property
+    def idle(self):
+        return self._queue.empty()
+
+    def start(self):
+        for index in range(self._workers_count):
+            Thread(target=self._work, name=f"{self.name}-{index}", daemon=True).start()
+
+    def submit(self, item):
+        """Queues item, or returns False when the lane is full"""
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            return False
+        return True
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._handler(item)
+            except Exception:
+                logging.error("Lane %s exception", self.name, exc_info=True)
+
+
+class ByteBudget:
+    """Limit on the bytes of requests handled at once. A request larger
+    than the whole budget is admitted when nothing else is in flight."""
+
+    def __init__(self, limit):
+        self._limit = limit
+        self._lock = Lock()
+        self.in_flight = 0
+
+    def acquire(self, size):
+        with self._lock:
+            if self.in_flight and self.in_flight + size > self._limit:
+                return False
+            self.in_flight += size
+            return True
+
+    def release(self, size):
+        with self._lock:
+            self.in_flight -= size
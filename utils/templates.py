@@ -0,0 +1,57 @@
+import html
+import re
+
+from models.exceptions import TemplateException
+
+SLOT_PATTERN = re.compile(r"\{\{\s*(\w+)(?:\s*\|\s*(\w+))?\s*\}\}")
+SLOT_KINDS = ("text", "raw")
+
+
+class Slot:
+    __slots__ = ("name", "kind")
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+
+
+class Template:
+    """Page split once into pre-encoded static segments and slots written
+    as {{ name }}. Text slots are HTML-escaped, {{ name|raw }} slots take
+    markup built by the server. Other braces are left as they are."""
+
+    def __init__(self, source, path=None):
+        self.segments = []
+        self.slots = {}
+        position = 0
+        for match in SLOT_PATTERN.finditer(source):
+            name, kind = match.group(1), match.group(2) or "text"
+            if kind not in SLOT_KINDS:
+                raise TemplateException(path, f"unknown slot kind {kind}")
+            self._add_static(source[position : match.start()])
+            slot = Slot(name, kind)
+            self.segments.append(slot)
+            self.slots[name] = slot
+            position = match.end()
+        self._add_static(source[position:])
+
+    def render(self, **values):
+        return b"".join(self.render_chunks(**values))
+
+    def render_chunks(self, **values):
+        """Yields static segments and encoded slot values. Missing values
+        render as empty strings."""
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                yield segment
+                continue
+            value = values.get(segment.name)
+            if value is None:
+                continue
+            if segment.kind == "text":
+                value = html.escape(str(value))
+            yield value.encode("utf-8")
+
+    def _add_static(self, text):
+        if text:
+            self.segments.append(text.encode("utf-8"))
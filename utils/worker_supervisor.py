@@ -0,0 +1,88 @@
+import os
+import signal
+import sys
+import time
+import traceback
+
+
+class _StopSupervisor(Exception):
+    pass
+
+
+class WorkerSupervisor:
+    def __init__(self, workers_count, start_worker, restart_delay=1.0, debug=False):
+        self._workers_count = workers_count
+        self._start_worker = start_worker
+        self._restart_delay = restart_delay
+        self._debug = debug
+        self._workers = {}
+        self._stopping = False
+
+    @property
+    def pids(self):
+        return list(self._workers.keys())
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        self.start()
+        try:
+            while not self._stopping:
+                self.wait_worker()
+        except _StopSupervisor:
+            pass
+        finally:
+            self.stop()
+
+    def start(self):
+        for index in range(self._workers_count):
+            self._spawn(index)
+
+    def wait_worker(self):
+        """Waits for any worker to exit and restarts it"""
+        pid, status = os.wait()
+        index, started = self._workers.pop(pid, (None, None))
+        if index is None or self._stopping:
+            return
+        if self._debug:
+            print(f"Worker {index} (pid {pid}) exited with status {status}")
+        if time.time() - started < self._restart_delay:
+            time.sleep(self._restart_delay)
+        self._spawn(index)
+
+    def stop(self):
+        self._stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self._workers.pop(pid, None)
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                self._start_worker(index)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self._workers[pid] = (index, time.time())
+        if self._debug:
+            print(f"Worker {index} started with pid {pid}")
+
+    def _handle_signal(self, signum, frame):
+        self._stopping = True
+        raise _StopSupervisor()